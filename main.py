@@ -1,41 +1,50 @@
 from contextlib import asynccontextmanager
 
 from fastapi import APIRouter, FastAPI
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.inmemory import InMemoryBackend
-from sqlalchemy import text
 
 from src.api.admin import router as admin_router
+from src.api.metrics import router as metrics_router
 from src.api.register import router as register_router
 from src.api.root import router as root_router
 from src.api.tw import router as tw_router
 from src.api.user import router as user_router
 from src.api.xui import router as xui_router
-from src.core.cache import request_key_builder
+from src.core.cache import close_cache, init_cache
 from src.core.enums import ServiceStatus
 from src.core.handlers import register_exception_handlers
 from src.core.logger import logger
+from src.core.middleware import register_middleware
 from src.core.settings import settings
-from src.schemas import Base
-from src.services.db import engine
+from src.services.db import engine, slow_query_log
+from src.services.health import health_prober
+from src.services.invoice_worker import invoice_worker
+from src.services.xui import close_xui_client, init_xui_client, load_xui_clients, sync_provisioned_xui_clients
+from src.services.xui_snapshot import xui_snapshot
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    FastAPICache.init(
-        InMemoryBackend(),
-        prefix=settings.cache.namespace,
-        key_builder=request_key_builder,
-    )
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        await conn.execute(
-            text(
-                "ALTER TABLE registration_codes "
-                "ADD COLUMN IF NOT EXISTS enable BOOLEAN NOT NULL DEFAULT TRUE"
-            )
+    await init_cache(engine)
+    init_xui_client()
+    if settings.xui.snapshot_enabled:
+        xui_snapshot.start(
+            load_xui_clients,
+            settings.xui.snapshot_refresh_interval_seconds,
+            # An in-process worker patches the snapshot itself.
+            sync=None if settings.worker.enabled else sync_provisioned_xui_clients,
+            sync_interval=settings.xui.snapshot_provisioned_sync_seconds,
         )
+    if settings.health.enabled:
+        health_prober.start()
+    if settings.worker.enabled:
+        invoice_worker.start()
     yield
+    await invoice_worker.stop()
+    await health_prober.stop()
+    await xui_snapshot.stop()
+    await close_xui_client()
+    await close_cache()
+    await slow_query_log.close()
     await engine.dispose()
 
 
@@ -46,6 +55,7 @@ app = FastAPI(
 )
 
 register_exception_handlers(app)
+register_middleware(app)
 
 api_router = APIRouter(prefix="/api")
 api_router.include_router(register_router)
@@ -54,6 +64,7 @@ api_router.include_router(admin_router)
 api_router.include_router(user_router)
 api_router.include_router(tw_router)
 api_router.include_router(xui_router)
+api_router.include_router(metrics_router)
 app.include_router(api_router)
 
 init_msg = """
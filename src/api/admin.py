@@ -1,17 +1,27 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.cache import app_cache, count_cache, registration_code_cache, user_identity_cache
 from src.core.deps import get_current_user, require_roles
-from src.core.enums import Role
+from src.core.enums import PaginationMode, Role
 from src.core.settings import settings
-from src.models.common import PaginatedResponse, build_paginated_response
+from src.core.tracing import TracedRoute
+from src.models.common import (
+    CacheStatsResponse,
+    CursorPaginatedResponse,
+    DbPoolStatsResponse,
+    PaginatedResponse,
+    SlowQueryResponse,
+    build_paginated_response,
+)
 from src.models.fields import USERNAME_MAX_LENGTH
 from src.models.registration import (
     CreateRegistrationCodeRequest,
     ExtendRegistrationCodeRequest,
     RegistrationCodeResponse,
 )
-from src.models.tw import AdminInvoiceResponse, InvoiceResponse
+from src.models.search import SearchResponse
+from src.models.tw import AdminInvoiceResponse, InvoiceResponse, InvoiceWorkerStatsResponse
 from src.models.users import (
     AdminUserResponse,
     CreateUserRequest,
@@ -20,15 +30,21 @@ from src.models.users import (
     UpdateUserRoleResponse,
     UserStatsResponse,
 )
-from src.models.xui import UpdateClientRequest
 from src.schemas.users import User
-from src.services.db import get_db
+from src.services.db import get_db, get_pool_stats, slow_query_log
+from src.services.invoice_worker import invoice_worker, process_invoices
 from src.services.registration import RegistrationService, get_registration_service
+from src.services.search import SearchService, get_search_service
 from src.services.tw import TimeWebService, get_timeweb_service
 from src.services.users import UserService, get_user_service
-from src.services.xui import XuiService, get_xui_service
+from src.services.xui import XuiService, get_xui_service, xui_inbounds_cache
 
-router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_roles(Role.SUPERUSER, Role.ADMIN))])
+router = APIRouter(
+    route_class=TracedRoute,
+    prefix="/admin",
+    tags=["admin"],
+    dependencies=[Depends(require_roles(Role.SUPERUSER, Role.ADMIN))],
+)
 
 
 @router.get("/links")
@@ -41,7 +57,53 @@ async def admin_links() -> dict[str, str]:
     }
 
 
+@router.get("/cache/auth")
+async def get_auth_cache_stats() -> CacheStatsResponse:
+    return user_identity_cache.stats()
+
+
+@router.get("/cache/counts")
+async def get_count_cache_stats() -> CacheStatsResponse:
+    return count_cache.stats()
+
+
+@router.get("/cache/registration-codes")
+async def get_registration_code_cache_stats() -> CacheStatsResponse:
+    return registration_code_cache.stats()
+
+
+@router.get("/cache/xui-inbounds")
+async def get_xui_inbounds_cache_stats() -> CacheStatsResponse:
+    return xui_inbounds_cache.stats()
+
+
+@router.get("/db/pool", dependencies=[Depends(require_roles(Role.SUPERUSER))])
+async def get_db_pool_stats() -> DbPoolStatsResponse:
+    return get_pool_stats()
+
+
+@router.get("/db/slow-queries", dependencies=[Depends(require_roles(Role.SUPERUSER))])
+async def get_slow_queries() -> list[SlowQueryResponse]:
+    return slow_query_log.recent()
+
+
+@router.delete("/db/slow-queries", dependencies=[Depends(require_roles(Role.SUPERUSER))])
+async def clear_slow_queries() -> None:
+    slow_query_log.clear()
+
+
+@router.get("/search")
+async def search(
+    q: str = Query(min_length=1, max_length=USERNAME_MAX_LENGTH),
+    limit: int = Query(default=10, ge=1, le=50),
+    db: AsyncSession = Depends(get_db),
+    search_service: SearchService = Depends(get_search_service),
+) -> SearchResponse:
+    return await search_service.search(db, q, limit)
+
+
 @router.get("/users/stats")
+@app_cache(tags=("users",))
 async def get_user_stats(
     db: AsyncSession = Depends(get_db),
     user_service: UserService = Depends(get_user_service),
@@ -50,19 +112,38 @@ async def get_user_stats(
 
 
 @router.get("/users")
+@app_cache(tags=("users",))
 async def list_users(
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1, le=100),
     search: str | None = Query(default=None, max_length=USERNAME_MAX_LENGTH),
     user_id: int | None = Query(default=None, ge=1),
     role: Role | None = None,
+    pagination: PaginationMode = PaginationMode.PAGE,
+    cursor: str | None = None,
+    with_total: bool = False,
+    approximate_total: bool = False,
     db: AsyncSession = Depends(get_db),
     user_service: UserService = Depends(get_user_service),
-) -> PaginatedResponse[AdminUserResponse]:
-    items, total, page = await user_service.list_users(
-        db, page=page, limit=limit, search=search, user_id=user_id, role=role
+) -> PaginatedResponse[AdminUserResponse] | CursorPaginatedResponse[AdminUserResponse]:
+    if pagination == PaginationMode.CURSOR:
+        items, next_cursor, total, total_exact = await user_service.list_users_by_cursor(
+            db,
+            cursor=cursor,
+            limit=limit,
+            search=search,
+            user_id=user_id,
+            role=role,
+            with_total=with_total,
+            approximate_total=approximate_total,
+        )
+        return CursorPaginatedResponse(
+            items=items, limit=limit, next_cursor=next_cursor, total=total, total_exact=total_exact
+        )
+    items, total, page, total_exact = await user_service.list_users(
+        db, page=page, limit=limit, search=search, user_id=user_id, role=role, approximate_total=approximate_total
     )
-    return build_paginated_response(items, total, page, limit)
+    return build_paginated_response(items, total, page, limit, total_exact)
 
 
 @router.post("/users/create")
@@ -110,6 +191,7 @@ async def update_user_mark(
 
 
 @router.get("/users/get/{id}")
+@app_cache(tags=("user:{id}",))
 async def get_user(
     id: int,
     db: AsyncSession = Depends(get_db),
@@ -128,6 +210,7 @@ async def delete_user(
 
 
 @router.get("/invoices")
+@app_cache(tags=("invoices",), cross_process=True)
 async def list_invoices(
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1, le=100),
@@ -135,10 +218,29 @@ async def list_invoices(
     invoice_id: int | None = Query(default=None, ge=1),
     id: int | None = Query(default=None, ge=1),
     username: str | None = Query(default=None, max_length=USERNAME_MAX_LENGTH),
+    pagination: PaginationMode = PaginationMode.PAGE,
+    cursor: str | None = None,
+    with_total: bool = False,
+    approximate_total: bool = False,
     db: AsyncSession = Depends(get_db),
     tw_service: TimeWebService = Depends(get_timeweb_service),
-) -> PaginatedResponse[AdminInvoiceResponse]:
-    items, total, page = await tw_service.list_invoices(
+) -> PaginatedResponse[AdminInvoiceResponse] | CursorPaginatedResponse[AdminInvoiceResponse]:
+    if pagination == PaginationMode.CURSOR:
+        items, next_cursor, total, total_exact = await tw_service.list_invoices_by_cursor(
+            db,
+            cursor=cursor,
+            limit=limit,
+            user_id=user_id,
+            invoice_id=invoice_id,
+            invoice_db_id=id,
+            username=username,
+            with_total=with_total,
+            approximate_total=approximate_total,
+        )
+        return CursorPaginatedResponse(
+            items=items, limit=limit, next_cursor=next_cursor, total=total, total_exact=total_exact
+        )
+    items, total, page, total_exact = await tw_service.list_invoices(
         db,
         page=page,
         limit=limit,
@@ -146,28 +248,24 @@ async def list_invoices(
         invoice_id=invoice_id,
         invoice_db_id=id,
         username=username,
+        approximate_total=approximate_total,
     )
-    return build_paginated_response(items, total, page, limit)
+    return build_paginated_response(items, total, page, limit, total_exact)
 
 
 @router.get("/invoices/check")
 async def check_invoices(
+    full_resync: bool = Query(default=False),
     db: AsyncSession = Depends(get_db),
     tw_service: TimeWebService = Depends(get_timeweb_service),
     xui_service: XuiService = Depends(get_xui_service),
-    user_service: UserService = Depends(get_user_service),
 ) -> list[InvoiceResponse]:
-    payed_invoices = await tw_service.check_invoices(db)
-    for invoice in payed_invoices:
-        user = await user_service.get_by_id(db, invoice.user_id)
-        if user is None:
-            continue
-        await xui_service.update_client_by_email(
-            user.username,
-            UpdateClientRequest(expiry_time_days=settings.app.default_expiry_time_days, enable=True),
-        )
-        await xui_service.reset_client_traffic_by_email(user.username)
-    return payed_invoices
+    return await process_invoices(db, tw_service, xui_service, full_resync=full_resync)
+
+
+@router.get("/invoices/worker")
+async def get_invoice_worker_stats(db: AsyncSession = Depends(get_db)) -> InvoiceWorkerStatsResponse:
+    return await invoice_worker.load_stats(db)
 
 
 @router.post("/invoices/{id}/cancel")
@@ -180,14 +278,18 @@ async def cancel_invoice(
 
 
 @router.get("/registration-codes")
+@app_cache(tags=("codes",))
 async def list_registration_codes(
     page: int = Query(default=1, ge=1),
     limit: int = Query(default=20, ge=1, le=100),
+    approximate_total: bool = False,
     db: AsyncSession = Depends(get_db),
     registration_service: RegistrationService = Depends(get_registration_service),
 ) -> PaginatedResponse[RegistrationCodeResponse]:
-    items, total, page = await registration_service.list_codes(db, page=page, limit=limit)
-    return build_paginated_response(items, total, page, limit)
+    items, total, page, total_exact = await registration_service.list_codes(
+        db, page=page, limit=limit, approximate_total=approximate_total
+    )
+    return build_paginated_response(items, total, page, limit, total_exact)
 
 
 @router.post("/registration-codes")
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
+
+from src.core.deps import require_roles
+from src.core.enums import Role
+from src.core.metrics import CONTENT_TYPE
+from src.core.settings import settings
+from src.core.tracing import TracedRoute
+from src.services.metrics import render_metrics
+
+router = APIRouter(
+    route_class=TracedRoute,
+    tags=["metrics"],
+    dependencies=[Depends(require_roles(Role.SUPERUSER))],
+)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics() -> PlainTextResponse:
+    if not settings.app.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
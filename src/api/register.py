@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.rate_limit import register_rate_limiter
+from src.core.tracing import TracedRoute
 from src.models.registration import RegisterRequest, RegisterValidationResponse
 from src.services.db import get_db
 from src.services.registration import RegistrationService, get_registration_service
 
-router = APIRouter(prefix="/register", tags=["register"])
+router = APIRouter(
+    route_class=TracedRoute,
+    prefix="/register",
+    tags=["register"],
+    dependencies=[Depends(register_rate_limiter)],
+)
 
 
 @router.get("/validate")
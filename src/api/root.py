@@ -1,53 +1,31 @@
 from fastapi import APIRouter, Depends
 
-from src.core.cache import app_cache
 from src.core.deps import require_roles
 from src.core.enums import Role, ServiceStatus
-from src.core.logger import get_logger
 from src.core.settings import settings
-from src.services.tw import TimeWebService, get_timeweb_service
-from src.services.xui import XuiService, get_xui_service
+from src.core.tracing import TracedRoute
+from src.services.health import health_prober
 
 router = APIRouter(
+    route_class=TracedRoute,
     tags=["root"],
     dependencies=[Depends(require_roles(Role.USER, Role.ADMIN, Role.SUPERUSER))],
 )
 
-logger = get_logger()
-
 
 @router.get("/status")
-@app_cache()
-async def read_status(
-    xui_service: XuiService = Depends(get_xui_service),
-    timeweb_service: TimeWebService = Depends(get_timeweb_service),
-) -> dict:
-    try:
-        xui_version = await xui_service.get_version()
-        xui_status = ServiceStatus.OK
-    except Exception as e:
-        logger.error(f"Error getting XUI version: {e}")
-        xui_version = "0.0.0"
-        xui_status = ServiceStatus.ERROR
-
-    try:
-        timeweb_status = await timeweb_service.get_status()
-    except Exception as e:
-        logger.error(f"Error getting TimeWeb status: {e}")
-        timeweb_status = ServiceStatus.ERROR
-
+async def read_status() -> dict:
+    if not settings.health.enabled:
+        await health_prober.refresh_if_stale()
+    services = {
+        name: health.model_dump(mode="json", exclude_none=True) for name, health in health_prober.snapshot().items()
+    }
     return {
         "API": {
             "version": settings.app.version,
             "status": ServiceStatus.OK,
         },
-        "XUI-Panel": {
-            "version": xui_version,
-            "status": xui_status,
-        },
-        "TimeWeb-API": {
-            "status": timeweb_status,
-        },
+        **services,
         "avilable_statuses": list(ServiceStatus),
     }
 
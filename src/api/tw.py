@@ -3,12 +3,13 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.deps import get_current_user, require_roles
 from src.core.enums import Role
+from src.core.tracing import TracedRoute
 from src.models.tw import FinancesResponse, InvoiceResponse, NewInvoiceRequest, PaymentResponse, PaymentReturnRequest
 from src.schemas.users import User
 from src.services.db import get_db
 from src.services.tw import TimeWebService, get_timeweb_service
 
-router = APIRouter(prefix="/tw", tags=["timeweb"])
+router = APIRouter(prefix="/tw", tags=["timeweb"], route_class=TracedRoute)
 
 
 @router.get("/finances", dependencies=[Depends(require_roles(Role.SUPERUSER))])
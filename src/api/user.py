@@ -1,18 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.cache import app_cache
 from src.core.deps import get_current_user
 from src.core.enums import Role
+from src.core.tracing import TracedRoute
 from src.models.users import UserProfileResponse
 from src.models.xui import ClientResponse
 from src.schemas.users import User
 from src.services.db import get_db
 from src.services.users import UserService, get_user_service
 
-router = APIRouter(prefix="/user", tags=["user"])
+router = APIRouter(prefix="/user", tags=["user"], route_class=TracedRoute)
 
 
 @router.get("/me")
+@app_cache(tags=("user:{user.id}",), cross_process=True)
 async def get_me(
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
@@ -2,10 +2,24 @@ from fastapi import APIRouter, Depends, HTTPException
 
 from src.core.deps import require_roles
 from src.core.enums import Role
-from src.models.xui import ClientResponse, CreateClientRequest, UpdateClientRequest
+from src.core.tracing import TracedRoute
+from src.models.common import HttpPoolStatsResponse
+from src.models.xui import (
+    ClientResponse,
+    CreateClientRequest,
+    CreatedClientResponse,
+    UpdateClientRequest,
+    XuiSnapshotStatsResponse,
+)
 from src.services.xui import XuiService, get_xui_service
+from src.services.xui_snapshot import xui_snapshot
 
-router = APIRouter(prefix="/xui", tags=["xui"], dependencies=[Depends(require_roles(Role.SUPERUSER, Role.ADMIN))])
+router = APIRouter(
+    route_class=TracedRoute,
+    prefix="/xui",
+    tags=["xui"],
+    dependencies=[Depends(require_roles(Role.SUPERUSER, Role.ADMIN))],
+)
 
 
 @router.get("/inbounds")
@@ -13,8 +27,30 @@ async def get_inbounds(xui_service: XuiService = Depends(get_xui_service)) -> li
     return await xui_service.get_inbounds_ids()
 
 
+@router.post("/inbounds/refresh")
+async def refresh_inbounds(xui_service: XuiService = Depends(get_xui_service)) -> list[int]:
+    return await xui_service.refresh_inbounds_ids()
+
+
+@router.get("/pool-stats")
+async def get_pool_stats(xui_service: XuiService = Depends(get_xui_service)) -> HttpPoolStatsResponse:
+    return xui_service.get_pool_stats()
+
+
+@router.get("/snapshot")
+async def get_snapshot_stats() -> XuiSnapshotStatsResponse:
+    return xui_snapshot.stats()
+
+
+@router.post("/snapshot/refresh")
+async def refresh_snapshot(xui_service: XuiService = Depends(get_xui_service)) -> XuiSnapshotStatsResponse:
+    return await xui_service.refresh_snapshot()
+
+
 @router.post("/clients/add")
-async def add_client(client: CreateClientRequest, xui_service: XuiService = Depends(get_xui_service)) -> str:
+async def add_client(
+    client: CreateClientRequest, xui_service: XuiService = Depends(get_xui_service)
+) -> CreatedClientResponse:
     return await xui_service.add_client_to_inbounds(client)
 
 
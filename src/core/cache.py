@@ -1,17 +1,46 @@
+import asyncio
 import hashlib
-from collections.abc import Awaitable, Callable
-from typing import Any, ParamSpec, TypeVar
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable, Sequence
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import partial, wraps
+from inspect import isawaitable
+from typing import Any, Generic, ParamSpec, TypeVar
 
 from fastapi_cache import FastAPICache
 from fastapi_cache.decorator import cache as fastapi_cache
-from fastapi_cache.types import KeyBuilder
+from fastapi_cache.types import Backend, KeyBuilder
+from sqlalchemy.ext.asyncio import AsyncEngine
 from starlette.requests import Request
 from starlette.responses import Response
 
+from src.core.cache_backends import (
+    InvalidationBus,
+    LocalBackend,
+    PostgresBackend,
+    PostgresInvalidationBus,
+    RedisBackend,
+    RedisInvalidationBus,
+    TieredBackend,
+)
+from src.core.enums import CacheBackend
+from src.core.logger import get_logger
+from src.core.metrics import response_cache_lookups, response_cache_misses
 from src.core.settings import settings
+from src.models.common import CacheStatsResponse
+
+logger = get_logger()
 
 P = ParamSpec("P")
 R = TypeVar("R")
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Distinguishes a cache miss from a cached None.
+MISSING = object()
 
 # Headers that affect response representation (HTTP Vary-style), not auth.
 VARY_HEADERS = ("accept", "accept-language", "accept-encoding")
@@ -45,18 +74,367 @@ def request_key_builder(
     return f"{namespace}:{digest}"
 
 
+# Bus messages in this namespace carry a user id to drop from user_identity_cache.
+IDENTITY_INVALIDATION_NAMESPACE = "auth"
+
+# Invalidating a tag deletes its token; entries keyed with the old token are never read again.
+TAG_TOKEN_TTL_SECONDS = 86_400
+CACHE_RESPONSE_PARAM = "__fastapi_cache_response"
+
+
+def _tag_key(tag: str) -> str:
+    return f"{settings.cache.namespace}:tag:{tag}"
+
+
+def user_tag(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+async def _tag_tokens(backend: Backend, tags: list[str]) -> list[str]:
+    tokens = []
+    for tag in tags:
+        token = await backend.get(_tag_key(tag))
+        if token is None:
+            token = uuid.uuid4().hex.encode()
+            await backend.set(_tag_key(tag), token, TAG_TOKEN_TTL_SECONDS)
+        tokens.append(token.decode())
+    return tokens
+
+
+def tagged_key_builder(tags: Sequence[str], key_builder: KeyBuilder = request_key_builder) -> KeyBuilder:
+    # Tags are format strings over the endpoint kwargs, e.g. "user:{user.id}".
+    async def build(
+        func: Callable[..., Any],
+        namespace: str = "",
+        *,
+        request: Request | None = None,
+        response: Response | None = None,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> str:
+        key = key_builder(func, namespace, request=request, response=response, args=args, kwargs=kwargs)
+        if isawaitable(key):
+            key = await key
+        names = [tag.format(**kwargs) for tag in tags]
+        tokens = await _tag_tokens(FastAPICache.get_backend(), names)
+        version = "|".join(f"{name}={token}" for name, token in zip(names, tokens))
+        return f"{key}:{hashlib.md5(version.encode(), usedforsecurity=False).hexdigest()}"
+
+    return build
+
+
+def _recording_key_builder(key_builder: KeyBuilder) -> KeyBuilder:
+    # fastapi-cache2 calls the key builder right before the endpoint on a miss, in the same task.
+    async def build(
+        func: Callable[..., Any],
+        namespace: str = "",
+        *,
+        request: Request | None = None,
+        response: Response | None = None,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+    ) -> str:
+        key = key_builder(func, namespace, request=request, response=response, args=args, kwargs=kwargs)
+        if isawaitable(key):
+            key = await key
+        _current_cache_key.set(key)
+        response_cache_lookups.inc()
+        return key
+
+    return build
+
+
+def invalidations_are_shared() -> bool:
+    # The invoice worker usually runs in its own process; with the memory backend its invalidations stay there.
+    return settings.cache.backend != CacheBackend.MEMORY or settings.worker.enabled
+
+
 def app_cache(
     *,
     expire: int | None = None,
     key_builder: KeyBuilder | None = None,
+    tags: Sequence[str] = (),
+    cross_process: bool = False,
 ) -> Callable[[Callable[P, Awaitable[R]]], Callable[P, Awaitable[R]]]:
+    # cross_process: the data is also changed by another process, so only cache when its invalidations reach here.
+    if cross_process and not invalidations_are_shared():
+        return lambda func: func
     ttl = settings.cache.default_ttl_seconds if expire is None else expire
+    key_builder = key_builder or request_key_builder
+    if tags:
+        key_builder = tagged_key_builder(tags, key_builder)
+    key_builder = _recording_key_builder(key_builder)
 
     def decorator(func: Callable[P, Awaitable[R]]) -> Callable[P, Awaitable[R]]:
-        return fastapi_cache(expire=ttl, key_builder=key_builder)(func)
+        @wraps(func)
+        async def coalesced(*args: P.args, **kwargs: P.kwargs) -> R:
+            # Concurrent misses for one key wait for a single computation.
+            key = _current_cache_key.get()
+            if key is None:
+                return await func(*args, **kwargs)
+            _current_cache_key.set(None)
+            response_cache_misses.inc()
+            return await response_flight.do(key, partial(func, *args, **kwargs))
+
+        cached = fastapi_cache(expire=ttl, key_builder=key_builder)(coalesced)
+        if not tags:
+            return cached
+
+        @wraps(cached)
+        async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            response = kwargs.get(CACHE_RESPONSE_PARAM)
+            result = await cached(*args, **kwargs)
+            # Tagged entries are invalidated server-side, so browsers must revalidate instead of reusing max-age.
+            if isinstance(response, Response):
+                response.headers["Cache-Control"] = "private, no-cache"
+            return result
+
+        return wrapper
 
     return decorator
 
 
+async def invalidate_tags(*tags: str) -> None:
+    try:
+        backend = FastAPICache.get_backend()
+    except AssertionError:
+        # The response cache is not initialized in this process (e.g. a one-off script).
+        return
+    for tag in tags:
+        try:
+            await backend.clear(key=_tag_key(tag))
+        except Exception as e:
+            logger.error("Error invalidating cache tag %s: %s", tag, e)
+
+
 async def invalidate_all_cache() -> int:
-    return await FastAPICache.clear(namespace=settings.cache.namespace)
+    # FastAPICache.clear() without a namespace targets the whole prefix (settings.cache.namespace).
+    return await FastAPICache.clear()
+
+
+def build_cache_backend(engine: AsyncEngine) -> Backend:
+    if settings.cache.backend == CacheBackend.MEMORY:
+        return LocalBackend()
+
+    if settings.cache.backend == CacheBackend.REDIS:
+        try:
+            from redis.asyncio import Redis
+        except ImportError as error:
+            raise RuntimeError("CACHE__BACKEND=redis requires the redis extra (uv sync --extra redis)") from error
+        redis = Redis.from_url(settings.cache.redis_url)
+        shared: Backend = RedisBackend(redis)
+        bus: InvalidationBus = RedisInvalidationBus(redis, settings.cache.invalidation_channel)
+    else:
+        shared = PostgresBackend(engine)
+        bus = PostgresInvalidationBus(engine, settings.cache.invalidation_channel)
+
+    # Without the local tier the bus still carries user_identity_cache invalidations.
+    local = LocalBackend() if settings.cache.two_tier else None
+    return TieredBackend(shared, local, settings.cache.local_ttl_seconds, bus)
+
+
+async def _on_invalidate(backend: TieredBackend, namespace: str | None, key: str | None) -> None:
+    if namespace == IDENTITY_INVALIDATION_NAMESPACE:
+        if key is not None:
+            user_identity_cache.invalidate(int(key))
+        return
+    if namespace is None and key is None:
+        # Sent after (re)subscribing: messages may have been lost, so drop every process-local copy.
+        user_identity_cache.clear()
+    await backend.clear_local(namespace, key)
+
+
+async def init_cache(engine: AsyncEngine) -> None:
+    backend = build_cache_backend(engine)
+    FastAPICache.init(backend, prefix=settings.cache.namespace, key_builder=request_key_builder)
+    if isinstance(backend, TieredBackend):
+        await backend.start(partial(_on_invalidate, backend))
+
+
+async def invalidate_user_identity(user_id: int) -> None:
+    # With CACHE__BACKEND=memory other processes keep the old identity for up to CACHE__AUTH_TTL_SECONDS.
+    user_identity_cache.invalidate(user_id)
+    try:
+        backend = FastAPICache.get_backend()
+    except AssertionError:
+        return
+    if isinstance(backend, TieredBackend) and backend.bus is not None:
+        try:
+            await backend.bus.publish(IDENTITY_INVALIDATION_NAMESPACE, str(user_id))
+        except Exception as e:
+            logger.error("Error publishing identity invalidation for user %s: %s", user_id, e)
+
+
+async def close_cache() -> None:
+    backend = FastAPICache.get_backend()
+    if isinstance(backend, TieredBackend):
+        await backend.stop()
+        backend = backend.shared
+    if isinstance(backend, RedisBackend):
+        await backend.redis.aclose()
+
+
+# Process-local LRU cache with per-entry expiry; ttl_seconds=0 disables it.
+@dataclass
+class TTLCache(Generic[K, V]):
+    ttl_seconds: float
+    max_size: int
+    hits: int = 0
+    misses: int = 0
+    _items: OrderedDict[K, tuple[float, V]] = field(default_factory=OrderedDict)
+
+    def get(self, key: K, default: Any = None) -> V | Any:
+        item = self._items.get(key)
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key: K, value: V) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        self._items[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, key: K) -> None:
+        self._items.pop(key, None)
+
+    def invalidate_matching(self, predicate: Callable[[K], bool]) -> None:
+        for key in [key for key in self._items if predicate(key)]:
+            del self._items[key]
+
+    def clear(self) -> None:
+        self._items.clear()
+
+    def stats(self) -> CacheStatsResponse:
+        return CacheStatsResponse(size=len(self._items), max_size=self.max_size, hits=self.hits, misses=self.misses)
+
+
+# Concurrent callers of the same key share one in-flight load instead of each starting their own.
+@dataclass
+class SingleFlight(Generic[K, V]):
+    coalesced: int = 0
+    _tasks: dict[K, asyncio.Task] = field(default_factory=dict)
+
+    def in_flight(self, key: K) -> bool:
+        return key in self._tasks
+
+    async def do(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.create_task(loader())
+            self._tasks[key] = task
+            task.add_done_callback(partial(self._forget, key))
+        else:
+            self.coalesced += 1
+        # A cancelled caller must not cancel the load the other callers are waiting on.
+        return await asyncio.shield(task)
+
+    def _forget(self, key: K, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # Marks the exception as retrieved when every waiter has gone away.
+            task.exception()
+
+
+# Process-local LRU cache that serves expired entries for stale_seconds while one background load refreshes them.
+@dataclass
+class StaleWhileRevalidateCache(Generic[K, V]):
+    fresh_seconds: float
+    stale_seconds: float
+    max_size: int
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    _items: OrderedDict[K, tuple[float, V]] = field(default_factory=OrderedDict)
+    _flight: SingleFlight[K, V] = field(default_factory=SingleFlight)
+    _version: int = 0
+    _refreshes: set[asyncio.Task] = field(default_factory=set)
+
+    async def get(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        item = self._items.get(key)
+        if item is not None:
+            age = time.monotonic() - item[0]
+            if age < self.fresh_seconds:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if age < self.fresh_seconds + self.stale_seconds:
+                self.stale_hits += 1
+                self._refresh(key, loader)
+                return item[1]
+        self.misses += 1
+        return await self._flight.do(key, partial(self._load, key, loader))
+
+    async def _load(self, key: K, loader: Callable[[], Awaitable[V]]) -> V:
+        version = self._version
+        value = await loader()
+        # A load that started before an invalidation must not store its result.
+        if version == self._version and self.fresh_seconds > 0:
+            self._items[key] = (time.monotonic(), value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return value
+
+    def _refresh(self, key: K, loader: Callable[[], Awaitable[V]]) -> None:
+        if self._flight.in_flight(key):
+            return
+
+        async def refresh() -> None:
+            try:
+                await self._flight.do(key, partial(self._load, key, loader))
+            except Exception as e:
+                logger.error("Error refreshing cached value for %r: %s", key, e)
+
+        task = asyncio.create_task(refresh())
+        self._refreshes.add(task)
+        task.add_done_callback(self._refreshes.discard)
+
+    def invalidate(self, key: K) -> None:
+        self._version += 1
+        self._items.pop(key, None)
+
+    def clear(self) -> None:
+        self._version += 1
+        self._items.clear()
+
+    def stats(self) -> CacheStatsResponse:
+        return CacheStatsResponse(
+            size=len(self._items),
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+            stale_hits=self.stale_hits,
+            coalesced=self._flight.coalesced,
+        )
+
+
+# Cache key of the response being computed by the current request; set by the app_cache key builder.
+_current_cache_key: ContextVar[str | None] = ContextVar("current_cache_key", default=None)
+response_flight: SingleFlight[str, Any] = SingleFlight()
+
+# user_id -> (username, role, token_position, mark) for get_current_user.
+user_identity_cache: TTLCache[int, tuple[str, str, int, str]] = TTLCache(
+    ttl_seconds=settings.cache.auth_ttl_seconds,
+    max_size=settings.cache.auth_max_size,
+)
+
+# (table, filter signature) -> exact row count for paginated admin listings.
+count_cache: TTLCache[tuple, int] = TTLCache(
+    ttl_seconds=settings.cache.count_ttl_seconds,
+    max_size=settings.cache.count_max_size,
+)
+
+# registration code value -> detached RegistrationCode, or None for codes that do not exist.
+registration_code_cache: TTLCache[str, Any] = TTLCache(
+    ttl_seconds=settings.cache.registration_code_ttl_seconds,
+    max_size=settings.cache.registration_code_max_size,
+)
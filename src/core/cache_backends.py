@@ -0,0 +1,345 @@
+import abc
+import asyncio
+import json
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.types import Backend
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.core.logger import get_logger
+
+logger = get_logger()
+
+# Identifies this process on the invalidation channel so it skips its own messages.
+PROCESS_ID = uuid.uuid4().hex
+
+OnInvalidate = Callable[[str | None, str | None], Awaitable[None]]
+
+
+class RedisBackend(Backend):
+    # Same contract as fastapi-cache2's RedisBackend, but clears by SCAN instead of a blocking KEYS.
+    def __init__(self, redis: Any) -> None:
+        self.redis = redis
+
+    async def get_with_ttl(self, key: str) -> tuple[int, bytes | None]:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            ttl, value = await pipe.ttl(key).get(key).execute()
+        return max(ttl, 0), value
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.redis.get(key)
+
+    async def set(self, key: str, value: bytes, expire: int | None = None) -> None:
+        await self.redis.set(key, value, ex=expire or None)
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        if namespace:
+            count = 0
+            async for name in self.redis.scan_iter(match=f"{namespace}:*", count=500):
+                count += await self.redis.unlink(name)
+            return count
+        if key:
+            return await self.redis.unlink(key)
+        return 0
+
+
+class PostgresBackend(Backend):
+    # Entries live in the UNLOGGED cache_entries table: no WAL writes, emptied after a crash.
+    purge_interval_seconds = 60
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self._purged_at = time.monotonic()
+
+    async def get_with_ttl(self, key: str) -> tuple[int, bytes | None]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                text(
+                    "SELECT value, ceil(extract(epoch FROM expires_at - now()))::int FROM cache_entries "
+                    "WHERE key = :key AND (expires_at IS NULL OR expires_at > now())"
+                ),
+                {"key": key},
+            )
+            row = result.one_or_none()
+        if row is None:
+            return 0, None
+        value, ttl = row
+        return ttl or 0, value
+
+    async def get(self, key: str) -> bytes | None:
+        _, value = await self.get_with_ttl(key)
+        return value
+
+    async def set(self, key: str, value: bytes, expire: int | None = None) -> None:
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                text(
+                    "INSERT INTO cache_entries (key, value, expires_at) "
+                    "VALUES (:key, :value, now() + NULLIF(:expire, 0) * interval '1 second') "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at"
+                ),
+                {"key": key, "value": value, "expire": expire or 0},
+            )
+            if time.monotonic() - self._purged_at >= self.purge_interval_seconds:
+                self._purged_at = time.monotonic()
+                await conn.execute(text("DELETE FROM cache_entries WHERE expires_at <= now()"))
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        async with self.engine.begin() as conn:
+            if namespace:
+                result = await conn.execute(
+                    text("DELETE FROM cache_entries WHERE starts_with(key, :prefix)"), {"prefix": f"{namespace}:"}
+                )
+            elif key:
+                result = await conn.execute(text("DELETE FROM cache_entries WHERE key = :key"), {"key": key})
+            else:
+                return 0
+        return result.rowcount
+
+
+class InvalidationBus(abc.ABC):
+    @abc.abstractmethod
+    async def publish(self, namespace: str | None, key: str | None) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def start(self, on_invalidate: OnInvalidate) -> None:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def stop(self) -> None:
+        raise NotImplementedError
+
+    @staticmethod
+    def _encode(namespace: str | None, key: str | None) -> str:
+        return json.dumps({"origin": PROCESS_ID, "namespace": namespace, "key": key})
+
+    @staticmethod
+    async def _dispatch(payload: str | bytes, on_invalidate: OnInvalidate) -> None:
+        try:
+            message = json.loads(payload)
+            if message["origin"] == PROCESS_ID:
+                return
+            await on_invalidate(message["namespace"], message["key"])
+        except Exception as e:
+            logger.error("Error handling cache invalidation message: %s", e)
+
+
+class InProcessInvalidationBus(InvalidationBus):
+    # In-process stand-in for the shared channels; every subscriber sees every other subscriber's messages.
+    def __init__(self) -> None:
+        self.subscribers: list[tuple[str, OnInvalidate]] = []
+        self.origin = uuid.uuid4().hex
+
+    async def publish(self, namespace: str | None, key: str | None) -> None:
+        for origin, on_invalidate in list(self.subscribers):
+            if origin != self.origin:
+                await on_invalidate(namespace, key)
+
+    async def start(self, on_invalidate: OnInvalidate) -> None:
+        self.subscribers.append((self.origin, on_invalidate))
+
+    async def stop(self) -> None:
+        # In place: attached buses share this list.
+        self.subscribers[:] = [item for item in self.subscribers if item[0] != self.origin]
+
+    def attach(self) -> "InProcessInvalidationBus":
+        # Returns a bus for another simulated process sharing the same subscribers.
+        bus = InProcessInvalidationBus()
+        bus.subscribers = self.subscribers
+        return bus
+
+
+class RedisInvalidationBus(InvalidationBus):
+    def __init__(self, redis: Any, channel: str) -> None:
+        self.redis = redis
+        self.channel = channel
+        self._task: asyncio.Task | None = None
+
+    async def publish(self, namespace: str | None, key: str | None) -> None:
+        await self.redis.publish(self.channel, self._encode(namespace, key))
+
+    async def _listen(self, on_invalidate: OnInvalidate) -> None:
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Messages sent while unsubscribed are lost, so start from an empty local tier.
+                    await on_invalidate(None, None)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            await self._dispatch(message["data"], on_invalidate)
+            except Exception as e:
+                logger.error("Cache invalidation listener disconnected: %s", e)
+                await asyncio.sleep(1)
+
+    async def start(self, on_invalidate: OnInvalidate) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen(on_invalidate), name="cache-invalidation")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class PostgresInvalidationBus(InvalidationBus):
+    # LISTEN needs its own long-lived connection, so the listener connects with asyncpg directly.
+    def __init__(self, engine: AsyncEngine, channel: str) -> None:
+        self.engine = engine
+        self.channel = channel
+        self._task: asyncio.Task | None = None
+        # The event loop only keeps weak references to tasks; these hold in-flight dispatches.
+        self._dispatches: set[asyncio.Task] = set()
+
+    async def publish(self, namespace: str | None, key: str | None) -> None:
+        async with self.engine.connect() as conn:
+            await conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": self._encode(namespace, key)},
+            )
+            await conn.commit()
+
+    async def _listen(self, on_invalidate: OnInvalidate) -> None:
+        import asyncpg
+
+        dsn = self.engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        while True:
+            conn = None
+            try:
+                conn = await asyncpg.connect(dsn, ssl=False)
+                await conn.add_listener(
+                    self.channel, lambda _conn, _pid, _channel, payload: self._spawn(payload, on_invalidate)
+                )
+                # Notifications sent while disconnected are lost, so start from an empty local tier.
+                await on_invalidate(None, None)
+                while not conn.is_closed():
+                    await asyncio.sleep(5)
+            except Exception as e:
+                logger.error("Cache invalidation listener disconnected: %s", e)
+                await asyncio.sleep(1)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+    def _spawn(self, payload: str, on_invalidate: OnInvalidate) -> None:
+        task = asyncio.create_task(self._dispatch(payload, on_invalidate))
+        self._dispatches.add(task)
+        task.add_done_callback(self._dispatches.discard)
+
+    async def start(self, on_invalidate: OnInvalidate) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen(on_invalidate), name="cache-invalidation")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class TieredBackend(Backend):
+    # Local entries never outlive local_ttl_seconds, which bounds staleness if an invalidation is missed.
+    def __init__(
+        self,
+        shared: Backend,
+        local: "LocalBackend | None" = None,
+        local_ttl_seconds: int = 5,
+        bus: InvalidationBus | None = None,
+    ) -> None:
+        self.shared = shared
+        self.local = local
+        self.local_ttl_seconds = local_ttl_seconds
+        self.bus = bus
+
+    def _local_ttl(self, ttl: int | None) -> int:
+        return min(ttl, self.local_ttl_seconds) if ttl else self.local_ttl_seconds
+
+    async def get_with_ttl(self, key: str) -> tuple[int, bytes | None]:
+        if self.local is not None:
+            ttl, value = await self.local.get_with_ttl(key)
+            if value is not None:
+                return ttl, value
+        ttl, value = await self.shared.get_with_ttl(key)
+        if value is not None and self.local is not None:
+            await self.local.set(key, value, self._local_ttl(ttl))
+        return ttl, value
+
+    async def get(self, key: str) -> bytes | None:
+        _, value = await self.get_with_ttl(key)
+        return value
+
+    async def set(self, key: str, value: bytes, expire: int | None = None) -> None:
+        await self.shared.set(key, value, expire)
+        if self.local is not None:
+            await self.local.set(key, value, self._local_ttl(expire))
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        count = await self.shared.clear(namespace, key)
+        await self.clear_local(namespace, key)
+        if self.bus is not None:
+            await self.bus.publish(namespace, key)
+        return count
+
+    async def clear_local(self, namespace: str | None = None, key: str | None = None) -> None:
+        if self.local is None:
+            return
+        # A message without namespace and key drops the whole local tier.
+        if namespace is None and key is None:
+            namespace = ""
+        await self.local.clear(namespace, key)
+
+    async def start(self, on_invalidate: OnInvalidate | None = None) -> None:
+        if self.bus is not None and (self.local is not None or on_invalidate is not None):
+            await self.bus.start(on_invalidate or self.clear_local)
+
+    async def stop(self) -> None:
+        if self.bus is not None:
+            await self.bus.stop()
+
+
+class LocalBackend(InMemoryBackend):
+    # InMemoryBackend evicts only on read, and entries behind an invalidated tag are never read again.
+    purge_interval_seconds = 60
+
+    # InMemoryBackend keeps its store on the class; give each instance its own so tiers stay separate.
+    def __init__(self) -> None:
+        self._store = {}
+        self._lock = asyncio.Lock()
+        self._purged_at = time.monotonic()
+
+    async def set(self, key: str, value: bytes, expire: int | None = None) -> None:
+        await super().set(key, value, expire)
+        if time.monotonic() - self._purged_at >= self.purge_interval_seconds:
+            self._purged_at = time.monotonic()
+            await self.purge_expired()
+
+    async def purge_expired(self) -> int:
+        async with self._lock:
+            now = self._now
+            expired = [name for name, entry in self._store.items() if entry.ttl_ts < now]
+            for name in expired:
+                del self._store[name]
+        return len(expired)
+
+    async def clear(self, namespace: str | None = None, key: str | None = None) -> int:
+        if namespace is not None:
+            keys = [name for name in self._store if name.startswith(namespace)]
+            for name in keys:
+                del self._store[name]
+            return len(keys)
+        if key is not None and self._store.pop(key, None) is not None:
+            return 1
+        return 0
@@ -4,11 +4,13 @@ from fastapi import Depends, HTTPException, Security, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.cache import user_identity_cache
 from src.core.enums import Role
 from src.core.logger import get_logger
 from src.core.settings import settings
+from src.core.tracing import trace_span
 from src.schemas.users import User
-from src.services.db import get_db
+from src.services.db import get_db, release_connection
 from src.services.jwt import JwtService, get_jwt_service
 from src.services.users import UserService, get_user_service
 
@@ -17,6 +19,20 @@ security = HTTPBearer()
 logger = get_logger()
 
 
+async def _get_identity(db: AsyncSession, user_service: UserService, user_id: int) -> User | None:
+    identity = user_identity_cache.get(user_id)
+    if identity is not None:
+        username, role, token_position, mark = identity
+        return User(id=user_id, username=username, role=role, token_position=token_position, mark=mark)
+
+    db_user = await user_service.get_by_id(db, user_id)
+    # Handlers such as /status await upstreams without touching the DB again.
+    await release_connection(db)
+    if db_user is not None:
+        user_identity_cache.set(user_id, (db_user.username, db_user.role, db_user.token_position, db_user.mark))
+    return db_user
+
+
 async def get_current_user(
     credentials: Annotated[HTTPAuthorizationCredentials, Security(security)],
     jwt_service: JwtService = Depends(get_jwt_service),
@@ -32,28 +48,31 @@ async def get_current_user(
                 token_position=0,
                 mark="",
             )
-            logger.debug(f"Logged in with: {user}")
+            logger.debug("Logged in with: %s", user)
             return user
-        payload = await jwt_service.decode(credentials.credentials)
+        with trace_span("jwt"):
+            payload = await jwt_service.decode(credentials.credentials)
         user_data = {
             "user_id": int(payload["sub"]),
             "token_position": payload["token_position"],
         }
-        db_user = await user_service.get_by_id(db, user_data["user_id"])
+        db_user = await _get_identity(db, user_service, user_data["user_id"])
         if db_user is None:
-            logger.error(f"User not found while JWT decoding: {user_data['user_id']}")
+            logger.error("User not found while JWT decoding: %s", user_data["user_id"])
             raise HTTPException(status_code=401, detail="Invalid token")
         if db_user.token_position != user_data["token_position"]:
             logger.error(
-                f"Invalid token position for user {db_user.id}: "
-                f"{db_user.token_position} != {user_data['token_position']}"
+                "Invalid token position for user %s: %s != %s",
+                db_user.id,
+                db_user.token_position,
+                user_data["token_position"],
             )
             raise HTTPException(status_code=401, detail="Invalid token")
 
-        logger.debug(f"Logged in with: {db_user}")
+        logger.debug("Logged in with: %s", db_user)
         return db_user
     except Exception as e:
-        logger.error(f"Error getting current user from JWT: {e}")
+        logger.error("Error getting current user from JWT: %s", e)
         raise HTTPException(status_code=401, detail="Invalid token")
 
 
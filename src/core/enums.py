@@ -18,3 +18,19 @@ class InvoiceStatus(StrEnum):
     PROCESSING = auto()
     PAID = auto()
     CANCELLED = auto()
+
+
+class PaginationMode(StrEnum):
+    PAGE = auto()
+    CURSOR = auto()
+
+
+class CacheBackend(StrEnum):
+    MEMORY = auto()
+    REDIS = auto()
+    POSTGRES = auto()
+
+
+class LogFormat(StrEnum):
+    JSON = auto()
+    TEXT = auto()
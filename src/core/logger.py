@@ -1,19 +1,82 @@
+import atexit
+import json
 import logging
+import queue
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
 
+from src.core.enums import LogFormat
 from src.core.settings import settings
 
 LOGGER_NAME = "app"
 LOG_FORMAT = "[%(asctime)s]-[%(name)s]-[%(levelname)s]: %(message)s"
 
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+
+class RequestIdFilter(logging.Filter):
+    # Runs on the calling side of the queue, where the request context is still set.
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if request_id := getattr(record, "request_id", None):
+            entry["request_id"] = request_id
+        # Structured fields passed as logger.info(..., extra={"fields": {...}}).
+        entry.update(getattr(record, "fields", None) or {})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _build_stream_handler() -> logging.Handler:
+    handler = logging.StreamHandler()
+    if settings.app.log_format == LogFormat.JSON:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+# Handlers write to stderr from the listener thread, so a slow pipe never blocks the event loop.
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener = QueueListener(_queue, _build_stream_handler())
+_listener_started = False
+
+
+def start_logging() -> None:
+    global _listener_started
+    if not _listener_started:
+        _listener.start()
+        _listener_started = True
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    # Flushes queued records; called at interpreter exit.
+    global _listener_started
+    if _listener_started:
+        _listener.stop()
+        _listener_started = False
+
 
 def get_logger(name: str = LOGGER_NAME) -> logging.Logger:
     logger = logging.getLogger(name)
     logger.setLevel(logging.DEBUG if settings.app.debug else logging.INFO)
 
     if not logger.handlers:
-        handler = logging.StreamHandler()
-        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handler = QueueHandler(_queue)
+        handler.addFilter(RequestIdFilter())
         logger.addHandler(handler)
+        start_logging()
 
     logger.propagate = False
     return logger
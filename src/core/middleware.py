@@ -0,0 +1,85 @@
+import re
+import uuid
+
+from fastapi import FastAPI
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.core.logger import get_logger, request_id_var
+from src.core.metrics import http_request_duration
+from src.core.settings import settings
+from src.core.tracing import end_trace, route_template, start_trace
+
+logger = get_logger()
+
+REQUEST_ID_HEADER = "x-request-id"
+# Accept the proxy's id (nginx $request_id) only if it is short and cannot break log lines.
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def get_request_id(scope: Scope) -> str:
+    for name, value in scope["headers"]:
+        if name == REQUEST_ID_HEADER.encode():
+            request_id = value.decode("latin-1")
+            if REQUEST_ID_PATTERN.fullmatch(request_id):
+                return request_id
+            break
+    return uuid.uuid4().hex
+
+
+class ServerTimingMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = get_request_id(scope)
+        request_id_token = request_id_var.set(request_id)
+        trace, token = start_trace()
+        status_code = 500
+
+        async def send_with_timing(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers["X-Request-ID"] = request_id
+                if settings.app.server_timing_enabled:
+                    headers.append("Server-Timing", trace.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_trace(token)
+            route = trace.route or route_template(scope)
+            if settings.app.metrics_enabled:
+                http_request_duration.observe(trace.elapsed(), scope["method"], route, str(status_code))
+            if settings.app.request_log_enabled:
+                breakdown = trace.breakdown_ms()
+                total = breakdown.pop("total")
+                logger.info(
+                    "%s %s %s %sms %s",
+                    scope["method"],
+                    route,
+                    status_code,
+                    total,
+                    " ".join(f"{name}={ms}ms" for name, ms in breakdown.items()),
+                    extra={
+                        "fields": {
+                            "method": scope["method"],
+                            "route": route,
+                            "status": status_code,
+                            "duration_ms": total,
+                            "timings_ms": breakdown,
+                        }
+                    },
+                )
+            request_id_var.reset(request_id_token)
+
+
+def register_middleware(app: FastAPI) -> None:
+    app.add_middleware(ServerTimingMiddleware)
@@ -0,0 +1,70 @@
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from fastapi import HTTPException, Request
+
+from src.core.settings import settings
+
+
+def is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in settings.rate_limit.trusted_proxies)
+
+
+def get_client_key(request: Request) -> str:
+    if not request.client:
+        return "unknown"
+    if is_trusted_proxy(request.client.host):
+        real_ip = request.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip
+    return request.client.host
+
+
+# Per-client token buckets; the least recently seen clients are evicted beyond max_clients.
+@dataclass
+class TokenBucketLimiter:
+    rate_per_second: float
+    burst: int
+    max_clients: int
+    rejected: int = 0
+    _buckets: OrderedDict[str, tuple[float, float]] = field(default_factory=OrderedDict)
+
+    def acquire(self, key: str) -> float:
+        # Returns 0 when a token was taken, otherwise the seconds until the next one.
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate_per_second)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / self.rate_per_second
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+    async def __call__(self, request: Request) -> None:
+        retry_after = self.acquire(get_client_key(request))
+        if retry_after:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+
+register_rate_limiter = TokenBucketLimiter(
+    rate_per_second=settings.rate_limit.register_rate_per_second,
+    burst=settings.rate_limit.register_burst,
+    max_clients=settings.rate_limit.max_clients,
+)
@@ -1,13 +1,27 @@
 from functools import lru_cache
 from urllib.parse import quote_plus
 
-from pydantic import BaseModel, Field, computed_field
+from pydantic import BaseModel, Field, IPvAnyNetwork, computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from src.core.enums import CacheBackend, LogFormat
+
 
 class CacheSettings(BaseModel):
     namespace: str = Field(default="fast-ray-gram")
     default_ttl_seconds: int = Field(default=60)
+    backend: CacheBackend = Field(default=CacheBackend.MEMORY)
+    redis_url: str = Field(default="redis://localhost:6379/0")
+    # Shared backends keep a short-lived per-process copy in front of the shared store.
+    two_tier: bool = Field(default=True)
+    local_ttl_seconds: int = Field(default=5)
+    invalidation_channel: str = Field(default="frg_cache_invalidation")
+    auth_ttl_seconds: int = Field(default=30)
+    auth_max_size: int = Field(default=10_000)
+    count_ttl_seconds: int = Field(default=30)
+    count_max_size: int = Field(default=1_000)
+    registration_code_ttl_seconds: int = Field(default=15)
+    registration_code_max_size: int = Field(default=10_000)
 
 
 class AppSettings(BaseModel):
@@ -16,6 +30,7 @@ class AppSettings(BaseModel):
     host: str = Field(default="0.0.0.0")
     port: int = Field(default=8000)
     debug: bool = Field(default=False)
+    log_format: LogFormat = Field(default=LogFormat.JSON)
     request_timeout: int = Field(default=10)
     jwt_secret: str = Field(default="jwt_secret")
     jwt_exp_days: int = Field(default=365)
@@ -29,6 +44,9 @@ class AppSettings(BaseModel):
     monitoring_service_url: str = Field(default="http://localhost:8000/status/")
     boosty_url: str = Field(default="http://localhost")
     github_url: str = Field(default="https://github.com/axindri/FastRayGram")
+    server_timing_enabled: bool = Field(default=True)
+    request_log_enabled: bool = Field(default=True)
+    metrics_enabled: bool = Field(default=True)
 
 
 class DatabaseSettings(BaseModel):
@@ -37,6 +55,13 @@ class DatabaseSettings(BaseModel):
     user: str = Field(default="fastraygram")
     password: str = Field(default="change-me")
     db: str = Field(default="fastraygram")
+    pool_size: int = Field(default=3)
+    max_overflow: int = Field(default=2)
+    pool_timeout: float = Field(default=30)
+    pool_recycle: int = Field(default=-1)
+    pool_pre_ping: bool = Field(default=True)
+    echo: bool = Field(default=False)
+    migrations_lock_key: int = Field(default=731_000)
 
     @computed_field
     @property
@@ -50,6 +75,20 @@ class XuiPanelSettings(BaseModel):
     url: str = Field(default="http://localhost:8080/AbCd")
     sub_url: str = Field(default="http://localhost:8080/sub")
     api_key: str = Field(default="xui_api_key")
+    max_connections: int = Field(default=20)
+    max_keepalive_connections: int = Field(default=10)
+    keepalive_expiry: float = Field(default=30.0)
+    http2: bool = Field(default=False)
+    snapshot_enabled: bool = Field(default=True)
+    snapshot_refresh_interval_seconds: int = Field(default=60)
+    snapshot_max_age_seconds: int = Field(default=180)
+    # How often the API re-reads clients extended by a separate invoice-worker process; 0 disables it.
+    snapshot_provisioned_sync_seconds: float = Field(default=5)
+    inbounds_cache_ttl_seconds: int = Field(default=300)
+    inbounds_stale_seconds: int = Field(default=600)
+    # Opt-in: re-reads every created client from the panel after verify_delay_seconds.
+    verify_created_clients: bool = Field(default=False)
+    verify_delay_seconds: float = Field(default=5.0)
 
 
 class TimeWebSettings(BaseModel):
@@ -59,6 +98,8 @@ class TimeWebSettings(BaseModel):
     api_url: str = Field(default="https://timeweb.cloud/api/v1")
     token: str = Field(default="")
     payer_id: int = Field(default=0)
+    payments_page_size: int = Field(default=100)
+    payments_max_pages: int = Field(default=20)
     default_headers: dict = Field(
         default={
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) \
@@ -71,6 +112,42 @@ class TimeWebSettings(BaseModel):
     )
 
 
+class InvoiceWorkerSettings(BaseModel):
+    enabled: bool = Field(default=False)
+    interval_seconds: float = Field(default=30)
+    jitter_seconds: float = Field(default=5)
+    max_backoff_seconds: float = Field(default=300)
+    lock_key: int = Field(default=731_001)
+    provision_concurrency: int = Field(default=5)
+    # The standalone worker serves its own /metrics here (same bearer token as /api/metrics); 0 disables it.
+    metrics_host: str = Field(default="0.0.0.0")
+    metrics_port: int = Field(default=9100)
+
+
+class HealthProbeSettings(BaseModel):
+    enabled: bool = Field(default=True)
+    interval_seconds: float = Field(default=15)
+    timeout_seconds: float = Field(default=5)
+
+
+class SlowQuerySettings(BaseModel):
+    enabled: bool = Field(default=True)
+    threshold_ms: float = Field(default=200)
+    buffer_size: int = Field(default=100)
+    max_statement_length: int = Field(default=4000)
+    # Share of slow SELECTs re-run with EXPLAIN (ANALYZE, BUFFERS); 0 disables it.
+    explain_sample_rate: float = Field(default=0.0)
+    explain_timeout_ms: int = Field(default=5000)
+
+
+class RateLimitSettings(BaseModel):
+    register_rate_per_second: float = Field(default=2, gt=0)
+    register_burst: int = Field(default=20, ge=1)
+    max_clients: int = Field(default=10_000, ge=1)
+    # X-Real-IP is honoured only from these peers (nginx); anyone else could spoof it.
+    trusted_proxies: list[IPvAnyNetwork] = Field(default_factory=list)
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -84,6 +161,10 @@ class Settings(BaseSettings):
     database: DatabaseSettings = Field(default_factory=DatabaseSettings, alias="DB")
     xui: XuiPanelSettings = Field(default_factory=XuiPanelSettings, alias="XUI")
     timeweb: TimeWebSettings = Field(default_factory=TimeWebSettings, alias="TIMEWEB")
+    worker: InvoiceWorkerSettings = Field(default_factory=InvoiceWorkerSettings, alias="WORKER")
+    health: HealthProbeSettings = Field(default_factory=HealthProbeSettings, alias="HEALTH")
+    rate_limit: RateLimitSettings = Field(default_factory=RateLimitSettings, alias="RATE_LIMIT")
+    slow_query: SlowQuerySettings = Field(default_factory=SlowQuerySettings, alias="SLOW_QUERY")
 
 
 @lru_cache
@@ -0,0 +1,120 @@
+import time
+from collections.abc import Callable, Coroutine, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any
+
+from fastapi.routing import APIRoute
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Scope
+
+
+@dataclass
+class RequestTrace:
+    started: float = field(default_factory=time.perf_counter)
+    durations: dict[str, float] = field(default_factory=dict)
+    counts: dict[str, int] = field(default_factory=dict)
+    endpoint_finished_at: float | None = None
+    route: str | None = None
+
+    def add(self, name: str, seconds: float) -> None:
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def breakdown_ms(self) -> dict[str, float]:
+        # "app" is whatever is not attributed to a named span; concurrent spans can overlap, so clamp at 0.
+        total = self.elapsed()
+        breakdown = {name: round(seconds * 1000, 1) for name, seconds in self.durations.items()}
+        breakdown["app"] = round(max(0.0, total - sum(self.durations.values())) * 1000, 1)
+        breakdown["total"] = round(total * 1000, 1)
+        return breakdown
+
+    def server_timing(self) -> str:
+        entries = []
+        for name, ms in self.breakdown_ms().items():
+            count = self.counts.get(name)
+            desc = f';desc="{count} calls"' if count and count > 1 else ""
+            entries.append(f"{name};dur={ms}{desc}")
+        return ", ".join(entries)
+
+
+def route_template(scope: Scope) -> str:
+    # The matched route template keeps IDs and emails out of logs and metrics labels.
+    # Newer FastAPI resolves included routers lazily and keeps the prefixed template in its own context.
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    path = getattr(context, "path_format", None) or getattr(scope.get("route"), "path", None)
+    return path or "unmatched"
+
+
+_current_trace: ContextVar[RequestTrace | None] = ContextVar("request_trace", default=None)
+
+
+def start_trace() -> tuple[RequestTrace, Any]:
+    trace = RequestTrace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token: Any) -> None:
+    _current_trace.reset(token)
+
+
+def current_trace() -> RequestTrace | None:
+    return _current_trace.get()
+
+
+def record_span(name: str, seconds: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def trace_span(name: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+class TracedRoute(APIRoute):
+    # Splits handler time into the endpoint itself and the response serialization that follows it.
+    def __init__(self, path: str, endpoint: Callable[..., Coroutine[Any, Any, Any]], **kwargs: Any) -> None:
+        # include_router re-creates routes from the already wrapped endpoint.
+        if not getattr(endpoint, "__traced__", False):
+            endpoint = self._trace_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _trace_endpoint(endpoint: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Coroutine[Any, Any, Any]]:
+        @wraps(endpoint)
+        async def traced_endpoint(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                trace = _current_trace.get()
+                if trace is not None:
+                    trace.endpoint_finished_at = time.perf_counter()
+
+        traced_endpoint.__traced__ = True
+        return traced_endpoint
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def traced_handler(request: Request) -> Response:
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.route = route_template(request.scope)
+            response = await handler(request)
+            if trace is not None and trace.endpoint_finished_at is not None:
+                trace.add("serialize", time.perf_counter() - trace.endpoint_finished_at)
+            return response
+
+        return traced_handler
@@ -0,0 +1,21 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.core.settings import settings
+from src.migrations.runner import apply_migrations
+from src.migrations.versions import MIGRATIONS
+
+
+async def main() -> None:
+    # Runs as a one-off process before the API starts; the request pool is never used for DDL.
+    engine = create_async_engine(settings.database.url, poolclass=NullPool, connect_args={"ssl": False})
+    try:
+        await apply_migrations(engine, MIGRATIONS, settings.database.migrations_lock_key)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
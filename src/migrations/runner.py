@@ -0,0 +1,103 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from sqlalchemy import Connection, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from src.core.logger import get_logger
+
+logger = get_logger()
+
+
+@dataclass(frozen=True)
+class ConcurrentIndex:
+    name: str
+    # Everything after "ON": "<table> [USING <method>] (<columns>) [WHERE <predicate>]".
+    definition: str
+
+
+Step = str | ConcurrentIndex | Callable[[Connection], None]
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    steps: tuple[Step, ...]
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so such migrations run in autocommit.
+    concurrent: bool = False
+
+
+CREATE_MIGRATIONS_TABLE = (
+    "CREATE TABLE IF NOT EXISTS schema_migrations ("
+    "version INTEGER PRIMARY KEY, "
+    "name VARCHAR NOT NULL, "
+    "applied_at TIMESTAMP NOT NULL DEFAULT now())"
+)
+
+
+async def _create_index_concurrently(conn: AsyncConnection, index: ConcurrentIndex) -> None:
+    result = await conn.execute(
+        text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": index.name}
+    )
+    # An interrupted concurrent build leaves an invalid index behind, which IF NOT EXISTS would keep.
+    if result.scalar_one_or_none() is False:
+        logger.warning("Dropping invalid index %s before rebuilding it", index.name)
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+    await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {index.definition}"))
+
+
+async def _run_step(conn: AsyncConnection, step: Step) -> None:
+    if isinstance(step, ConcurrentIndex):
+        await _create_index_concurrently(conn, step)
+    elif isinstance(step, str):
+        await conn.execute(text(step))
+    else:
+        await conn.run_sync(step)
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+        {"version": migration.version, "name": migration.name},
+    )
+
+
+async def apply_migrations(engine: AsyncEngine, migrations: list[Migration], lock_key: int) -> list[int]:
+    versions = [migration.version for migration in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError("Migration versions must be unique and ascending")
+
+    applied_now: list[int] = []
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Concurrent deploys wait here instead of applying the same migration twice.
+        await lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": lock_key})
+        try:
+            await lock_conn.execute(text(CREATE_MIGRATIONS_TABLE))
+            result = await lock_conn.execute(text("SELECT version FROM schema_migrations"))
+            applied = set(result.scalars().all())
+
+            for migration in migrations:
+                if migration.version in applied:
+                    continue
+                logger.info("Applying migration %04d_%s", migration.version, migration.name)
+                if migration.concurrent:
+                    # Every step is idempotent, so a migration interrupted halfway is simply re-run.
+                    for step in migration.steps:
+                        await _run_step(lock_conn, step)
+                    await _record(lock_conn, migration)
+                else:
+                    async with engine.begin() as conn:
+                        for step in migration.steps:
+                            await _run_step(conn, step)
+                        await _record(conn, migration)
+                applied_now.append(migration.version)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": lock_key})
+
+    if applied_now:
+        logger.info("Applied migrations: %s", applied_now)
+    else:
+        logger.info("Database schema is up to date")
+    return applied_now
@@ -0,0 +1,173 @@
+from src.migrations.runner import ConcurrentIndex, Migration
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        version=1,
+        name="initial_schema",
+        # The schema as it was before migrations existed, frozen; every later column and index has its own migration.
+        # IF NOT EXISTS: databases created before migrations existed already have these tables.
+        steps=(
+            "CREATE TABLE IF NOT EXISTS registration_codes ("
+            "id SERIAL PRIMARY KEY, "
+            "code VARCHAR NOT NULL, "
+            "expires_at TIMESTAMP NOT NULL, "
+            "max_registrations INTEGER NOT NULL, "
+            "enable BOOLEAN NOT NULL, "
+            "created_by_id INTEGER, "
+            "created_at TIMESTAMP NOT NULL, "
+            "updated_at TIMESTAMP NOT NULL)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_registration_codes_code ON registration_codes (code)",
+            "CREATE TABLE IF NOT EXISTS users ("
+            "id SERIAL PRIMARY KEY, "
+            "username VARCHAR NOT NULL, "
+            "role VARCHAR NOT NULL, "
+            "token_position INTEGER NOT NULL, "
+            "sub_url VARCHAR NOT NULL, "
+            "mark VARCHAR NOT NULL, "
+            "registration_code_id INTEGER REFERENCES registration_codes (id) ON DELETE SET NULL, "
+            "created_at TIMESTAMP NOT NULL, "
+            "updated_at TIMESTAMP NOT NULL)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)",
+            "CREATE TABLE IF NOT EXISTS invoices ("
+            "id SERIAL PRIMARY KEY, "
+            "invoice_id INTEGER NOT NULL, "
+            "user_id INTEGER NOT NULL REFERENCES users (id), "
+            "payment_uuid VARCHAR NOT NULL UNIQUE, "
+            "confirmation_url VARCHAR NOT NULL, "
+            "amount INTEGER NOT NULL, "
+            "status VARCHAR NOT NULL, "
+            "created_at TIMESTAMP NOT NULL, "
+            "updated_at TIMESTAMP NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_invoices_invoice_id ON invoices (invoice_id)",
+            # users and registration_codes reference each other, so this key is added once both exist.
+            "DO $$ BEGIN "
+            "IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'registration_codes_created_by_id_fkey') THEN "
+            "ALTER TABLE registration_codes ADD CONSTRAINT registration_codes_created_by_id_fkey "
+            "FOREIGN KEY (created_by_id) REFERENCES users (id); "
+            "END IF; END $$",
+        ),
+    ),
+    Migration(
+        version=2,
+        name="registration_codes_enable",
+        steps=("ALTER TABLE registration_codes ADD COLUMN IF NOT EXISTS enable BOOLEAN NOT NULL DEFAULT TRUE",),
+    ),
+    Migration(
+        version=3,
+        name="invoices_provisioned_at",
+        # Invoices paid before provisioning was tracked are already applied in XUI.
+        steps=(
+            "DO $$ BEGIN "
+            "IF NOT EXISTS (SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'invoices' AND column_name = 'provisioned_at') THEN "
+            "ALTER TABLE invoices ADD COLUMN provisioned_at TIMESTAMP; "
+            "UPDATE invoices SET provisioned_at = updated_at WHERE status = 'paid'; "
+            "END IF; END $$",
+        ),
+    ),
+    Migration(
+        version=4,
+        name="users_trigram_indexes",
+        steps=(
+            # Needed by the gin_trgm_ops indexes below.
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            ConcurrentIndex("ix_users_username_trgm", "users USING gin (username gin_trgm_ops)"),
+            ConcurrentIndex("ix_users_mark_trgm", "users USING gin (mark gin_trgm_ops)"),
+        ),
+        concurrent=True,
+    ),
+    Migration(
+        version=5,
+        name="hot_path_indexes",
+        steps=(
+            ConcurrentIndex("ix_invoices_user_id_status", "invoices (user_id, status)"),
+            ConcurrentIndex(
+                "ix_invoices_open",
+                "invoices (created_at) WHERE status IN ('pending', 'processing')",
+            ),
+            ConcurrentIndex("ix_users_registration_code_id", "users (registration_code_id)"),
+        ),
+        concurrent=True,
+    ),
+    Migration(
+        version=6,
+        name="registration_codes_registrations_count",
+        steps=(
+            "ALTER TABLE registration_codes ADD COLUMN IF NOT EXISTS registrations_count INTEGER NOT NULL DEFAULT 0",
+            "UPDATE registration_codes SET registrations_count = counts.registrations "
+            "FROM (SELECT registration_code_id, count(*) AS registrations FROM users "
+            "WHERE registration_code_id IS NOT NULL GROUP BY registration_code_id) AS counts "
+            "WHERE registration_codes.id = counts.registration_code_id",
+        ),
+    ),
+    Migration(
+        version=7,
+        name="cache_entries",
+        # Shared response cache for CACHE__BACKEND=postgres; UNLOGGED skips WAL and is emptied after a crash.
+        steps=(
+            "CREATE UNLOGGED TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, "
+            "value BYTEA NOT NULL, "
+            "expires_at TIMESTAMPTZ)",
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_expires_at ON cache_entries (expires_at)",
+        ),
+    ),
+    Migration(
+        version=8,
+        name="invoices_provisioned_at_index",
+        steps=(
+            ConcurrentIndex(
+                "ix_invoices_provisioned_at",
+                "invoices (provisioned_at) WHERE provisioned_at IS NOT NULL",
+            ),
+        ),
+        concurrent=True,
+    ),
+    Migration(
+        version=9,
+        name="invoice_worker_state",
+        steps=(
+            "CREATE TABLE IF NOT EXISTS invoice_worker_state ("
+            "name VARCHAR PRIMARY KEY, "
+            "leader VARCHAR NOT NULL, "
+            "runs INTEGER NOT NULL DEFAULT 0, "
+            "failures INTEGER NOT NULL DEFAULT 0, "
+            "consecutive_failures INTEGER NOT NULL DEFAULT 0, "
+            "last_run_at TIMESTAMP NOT NULL, "
+            "last_run_duration_seconds DOUBLE PRECISION NOT NULL, "
+            "last_success_at TIMESTAMP, "
+            "last_error VARCHAR, "
+            "last_paid INTEGER NOT NULL DEFAULT 0, "
+            "last_provisioned INTEGER NOT NULL DEFAULT 0, "
+            "last_failed INTEGER NOT NULL DEFAULT 0, "
+            "created_at TIMESTAMP NOT NULL, "
+            "updated_at TIMESTAMP NOT NULL)",
+        ),
+    ),
+    Migration(
+        version=10,
+        name="invoices_status_rank_index",
+        # Same expression as INVOICE_STATUS_RANK_SQL, so the admin invoice listing order is read from the index.
+        steps=(
+            ConcurrentIndex(
+                "ix_invoices_status_rank",
+                "invoices ((CASE WHEN invoices.status IN ('pending', 'processing') THEN 0 ELSE 1 END), "
+                "created_at DESC, id DESC)",
+            ),
+        ),
+        concurrent=True,
+    ),
+    Migration(
+        version=11,
+        name="payment_cursors",
+        # Created by create_all in the first version of migration 1; already present on those databases.
+        steps=(
+            "CREATE TABLE IF NOT EXISTS payment_cursors ("
+            "source VARCHAR PRIMARY KEY, "
+            "last_payment_date TIMESTAMP NOT NULL, "
+            "last_invoice_id INTEGER NOT NULL, "
+            "created_at TIMESTAMP NOT NULL, "
+            "updated_at TIMESTAMP NOT NULL)",
+        ),
+    ),
+]
@@ -1,8 +1,14 @@
+import base64
+import binascii
+import json
+from datetime import datetime
 from math import ceil
-from typing import Generic, TypeVar
+from typing import Any, Generic, TypeVar
 
 from pydantic import BaseModel, Field
 
+from src.core.enums import ServiceStatus
+
 T = TypeVar("T")
 
 
@@ -12,9 +18,90 @@ class PaginatedResponse(BaseModel, Generic[T]):
     page: int = Field(ge=1)
     limit: int = Field(ge=1)
     pages: int = Field(ge=1)
+    total_exact: bool = True
 
 
-def build_paginated_response(items: list[T], total: int, page: int, limit: int) -> PaginatedResponse[T]:
+def build_paginated_response(
+    items: list[T], total: int, page: int, limit: int, total_exact: bool = True
+) -> PaginatedResponse[T]:
     pages = max(1, ceil(total / limit)) if total else 1
+    if not total_exact:
+        # An estimate may undercount, so never clamp the requested page to it.
+        pages = max(pages, page)
     safe_page = min(max(page, 1), pages)
-    return PaginatedResponse(items=items, total=total, page=safe_page, limit=limit, pages=pages)
+    return PaginatedResponse(
+        items=items, total=total, page=safe_page, limit=limit, pages=pages, total_exact=total_exact
+    )
+
+
+class CursorPaginatedResponse(BaseModel, Generic[T]):
+    items: list[T]
+    limit: int = Field(ge=1)
+    next_cursor: str | None = None
+    total: int | None = None
+    total_exact: bool = True
+
+
+def encode_cursor(values: list[Any]) -> str:
+    payload = json.dumps(values, default=str, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise ValueError("Invalid cursor") from error
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class HttpPoolStatsResponse(BaseModel):
+    closed: bool
+    connections: int
+    active_connections: int
+    idle_connections: int
+    active_requests: int
+    queued_requests: int
+
+
+class CacheStatsResponse(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    stale_hits: int = 0
+    coalesced: int = 0
+
+
+class DbPoolStatsResponse(BaseModel):
+    size: int
+    max_overflow: int
+    checked_out: int
+    idle: int
+    overflow: int
+    connects: int
+    checkouts: int
+    invalidations: int
+    timeouts: int
+    waits: int
+    wait_seconds_total: float
+    wait_seconds_max: float
+
+
+class SlowQueryResponse(BaseModel):
+    statement: str
+    parameters: str
+    duration_ms: float
+    route: str | None
+    recorded_at: datetime
+    plan: str | None = None
+
+
+class ServiceHealthResponse(BaseModel):
+    status: ServiceStatus
+    version: str | None = None
+    latency_ms: float | None = None
+    checked_at: datetime | None = None
+    last_success_at: datetime | None = None
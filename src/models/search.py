@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+from src.models.tw import AdminInvoiceResponse
+from src.models.users import AdminUserResponse
+
+
+class SearchResponse(BaseModel):
+    users: list[AdminUserResponse]
+    invoices: list[AdminInvoiceResponse]
@@ -72,3 +72,18 @@ class PaymentResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class InvoiceWorkerStatsResponse(BaseModel):
+    running: bool
+    leader: str | None = None
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    last_run_at: datetime | None = None
+    last_run_duration_seconds: float | None = None
+    last_success_at: datetime | None = None
+    last_error: str | None = None
+    last_paid: int = 0
+    last_provisioned: int = 0
+    last_failed: int = 0
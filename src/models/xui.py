@@ -29,8 +29,23 @@ class ClientResponse(BaseModel):
     inbound_ids: list[int]
 
 
+class CreatedClientResponse(BaseModel):
+    email: str
+    sub_id: str
+    sub_url: str
+    inbound_ids: list[int]
+
+
 class UpdateClientRequest(BaseModel):
     expiry_time_days: int | None = None
     enable: bool | None = None
     limit_ips: int | None = None
     comment: str | None = None
+
+
+class XuiSnapshotStatsResponse(BaseModel):
+    clients: int
+    fresh: bool
+    age_seconds: float | None
+    hits: int
+    misses: int
@@ -1,6 +1,8 @@
 from .base import Base
+from .invoice_worker_state import InvoiceWorkerState
 from .invoices import Invoice
+from .payment_cursors import PaymentCursor
 from .registration_codes import RegistrationCode
 from .users import User
 
-__all__ = ["Base", "Invoice", "RegistrationCode", "User"]
+__all__ = ["Base", "Invoice", "InvoiceWorkerState", "PaymentCursor", "RegistrationCode", "User"]
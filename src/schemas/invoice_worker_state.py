@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Float, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.schemas.base import Base
+
+
+class InvoiceWorkerState(Base):
+    # One row per worker, updated by the leader after each run so any process can report it.
+    __tablename__ = "invoice_worker_state"
+
+    name: Mapped[str] = mapped_column(String, primary_key=True)
+    leader: Mapped[str] = mapped_column(String)
+    runs: Mapped[int] = mapped_column(Integer, default=0)
+    failures: Mapped[int] = mapped_column(Integer, default=0)
+    consecutive_failures: Mapped[int] = mapped_column(Integer, default=0)
+    last_run_at: Mapped[datetime] = mapped_column(DateTime)
+    last_run_duration_seconds: Mapped[float] = mapped_column(Float)
+    last_success_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+    last_paid: Mapped[int] = mapped_column(Integer, default=0)
+    last_provisioned: Mapped[int] = mapped_column(Integer, default=0)
+    last_failed: Mapped[int] = mapped_column(Integer, default=0)
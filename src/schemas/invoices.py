@@ -1,12 +1,31 @@
-from sqlalchemy import ForeignKey, Integer, String
+from datetime import datetime
+
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.core.enums import InvoiceStatus
 from src.schemas.base import Base
 
+# Open invoices (awaiting payment) are listed first.
+INVOICE_STATUS_RANK_SQL = "CASE WHEN invoices.status IN ('pending', 'processing') THEN 0 ELSE 1 END"
+
 
 class Invoice(Base):
     __tablename__ = "invoices"
+    __table_args__ = (
+        Index("ix_invoices_user_id_status", "user_id", "status"),
+        # Open invoices are a small, hot subset: reconciliation and the stale-invoice sweep only touch these.
+        Index("ix_invoices_open", "created_at", postgresql_where=text("status IN ('pending', 'processing')")),
+        # The API polls for invoices the worker process provisioned since its last check.
+        Index("ix_invoices_provisioned_at", "provisioned_at", postgresql_where=text("provisioned_at IS NOT NULL")),
+        # Admin invoice listing order; queries must use INVOICE_STATUS_RANK_SQL verbatim to match the index.
+        Index(
+            "ix_invoices_status_rank",
+            text(f"({INVOICE_STATUS_RANK_SQL})"),
+            text("created_at DESC"),
+            text("id DESC"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     invoice_id: Mapped[int] = mapped_column(Integer, unique=False, index=True)
@@ -15,3 +34,4 @@ class Invoice(Base):
     confirmation_url: Mapped[str] = mapped_column(String)
     amount: Mapped[int]
     status: Mapped[str] = mapped_column(String, default=InvoiceStatus.PENDING)
+    provisioned_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
@@ -0,0 +1,14 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.schemas.base import Base
+
+
+class PaymentCursor(Base):
+    __tablename__ = "payment_cursors"
+
+    source: Mapped[str] = mapped_column(String, primary_key=True)
+    last_payment_date: Mapped[datetime] = mapped_column(DateTime)
+    last_invoice_id: Mapped[int] = mapped_column(Integer)
@@ -13,5 +13,6 @@ class RegistrationCode(Base):
     code: Mapped[str] = mapped_column(String, unique=True, index=True)
     expires_at: Mapped[datetime] = mapped_column(DateTime)
     max_registrations: Mapped[int] = mapped_column(Integer, default=1)
+    registrations_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     enable: Mapped[bool] = mapped_column(Boolean, default=True)
     created_by_id: Mapped[int | None] = mapped_column(Integer, ForeignKey("users.id"), nullable=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import ForeignKey, Integer, String
+from sqlalchemy import ForeignKey, Index, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.core.enums import Role
@@ -7,6 +7,17 @@ from src.schemas.base import Base
 
 class User(Base):
     __tablename__ = "users"
+    # Trigram indexes (pg_trgm) serve ILIKE '%term%' and similarity search.
+    __table_args__ = (
+        Index(
+            "ix_users_username_trgm",
+            "username",
+            postgresql_using="gin",
+            postgresql_ops={"username": "gin_trgm_ops"},
+        ),
+        Index("ix_users_mark_trgm", "mark", postgresql_using="gin", postgresql_ops={"mark": "gin_trgm_ops"}),
+        Index("ix_users_registration_code_id", "registration_code_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     username: Mapped[str] = mapped_column(String, unique=True, index=True)
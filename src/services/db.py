@@ -1,26 +1,256 @@
-from collections.abc import AsyncGenerator
+import asyncio
+import random
+import re
+import time
+from collections import deque
+from collections.abc import AsyncGenerator, Hashable
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any
 
 from fastapi import HTTPException
+from sqlalchemy import Select, event, text
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, NullPool
 
+from src.core.cache import count_cache
+from src.core.logger import get_logger
 from src.core.settings import settings
+from src.core.tracing import current_trace, record_span
+from src.models.common import DbPoolStatsResponse, SlowQueryResponse
+
+logger = get_logger()
 
 
 class Base(DeclarativeBase):
     pass
 
 
+@dataclass
+class PoolMetrics:
+    connects: int = 0
+    checkouts: int = 0
+    invalidations: int = 0
+    timeouts: int = 0
+    waits: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.waits += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self) -> ConnectionPoolEntry:
+        # Only a checkout with no idle connection and no overflow slot left queues for a free one;
+        # the rest take an idle connection or open a new one and are not counted as waits.
+        blocks = self.checkedin() == 0 and -1 < self._max_overflow <= self.overflow()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            if blocks:
+                pool_metrics.record_wait(time.perf_counter() - started)
+
+
 engine = create_async_engine(
     settings.database.url,
-    echo=settings.app.debug,
-    pool_size=3,
-    max_overflow=2,
-    pool_pre_ping=True,
+    echo=settings.database.echo,
+    poolclass=MeteredQueuePool,
+    pool_size=settings.database.pool_size,
+    max_overflow=settings.database.max_overflow,
+    pool_timeout=settings.database.pool_timeout,
+    pool_recycle=settings.database.pool_recycle,
+    pool_pre_ping=settings.database.pool_pre_ping,
     connect_args={"ssl": False},
 )
 
+
+@event.listens_for(engine.sync_engine.pool, "connect")
+def _on_connect(dbapi_connection, connection_record) -> None:
+    pool_metrics.connects += 1
+
+
+@event.listens_for(engine.sync_engine.pool, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy) -> None:
+    pool_metrics.checkouts += 1
+
+
+@event.listens_for(engine.sync_engine.pool, "invalidate")
+def _on_invalidate(dbapi_connection, connection_record, exception) -> None:
+    pool_metrics.invalidations += 1
+
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._trace_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    seconds = time.perf_counter() - context._trace_started
+    record_span("db", seconds)
+    if settings.slow_query.enabled and seconds * 1000 >= slow_query_log.threshold_ms:
+        slow_query_log.record(statement, parameters, executemany, seconds)
+
+
+def get_pool_stats() -> DbPoolStatsResponse:
+    pool = engine.sync_engine.pool
+    return DbPoolStatsResponse(
+        size=pool.size(),
+        max_overflow=settings.database.max_overflow,
+        checked_out=pool.checkedout(),
+        idle=pool.checkedin(),
+        overflow=max(0, pool.overflow()),
+        connects=pool_metrics.connects,
+        checkouts=pool_metrics.checkouts,
+        invalidations=pool_metrics.invalidations,
+        timeouts=pool_metrics.timeouts,
+        waits=pool_metrics.waits,
+        wait_seconds_total=round(pool_metrics.wait_seconds_total, 6),
+        wait_seconds_max=round(pool_metrics.wait_seconds_max, 6),
+    )
+
+
+# Only plain reads are re-run under EXPLAIN ANALYZE; anything that locks, writes or has side effects is skipped.
+EXPLAINABLE_STATEMENT = re.compile(r"^\s*SELECT\b", re.IGNORECASE)
+UNSAFE_TO_EXPLAIN = re.compile(
+    r"\b(FOR\s+(NO\s+KEY\s+)?UPDATE|FOR\s+(KEY\s+)?SHARE|INSERT|UPDATE|DELETE"
+    r"|nextval|setval|pg_\w*advisory\w*|pg_notify)\b",
+    re.IGNORECASE,
+)
+
+
+def _value_shape(value: Any) -> str:
+    if isinstance(value, list | tuple | set | frozenset):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameters_shape(parameters: Any, executemany: bool = False) -> str:
+    # Types and sizes only: values can be emails, tokens or password hashes.
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} x {parameters_shape(rows[0]) if rows else '()'}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}: {_value_shape(value)}" for name, value in parameters.items()) + "}"
+    if isinstance(parameters, list | tuple):
+        return "(" + ", ".join(_value_shape(value) for value in parameters) + ")"
+    return _value_shape(parameters)
+
+
+@dataclass
+class SlowQuery:
+    statement: str
+    parameters: str
+    duration_ms: float
+    route: str | None
+    recorded_at: datetime = field(default_factory=datetime.now)
+    plan: str | None = None
+
+
+@dataclass
+class SlowQueryLog:
+    threshold_ms: float
+    max_size: int
+    max_statement_length: int
+    explain_sample_rate: float
+    explain_timeout_ms: int
+    recorded: int = 0
+    entries: deque[SlowQuery] = field(init=False)
+    _explain_engine: AsyncEngine | None = None
+    _explain_task: asyncio.Task | None = None
+
+    def __post_init__(self) -> None:
+        self.entries = deque(maxlen=self.max_size)
+
+    def record(self, statement: str, parameters: Any, executemany: bool, seconds: float) -> None:
+        trace = current_trace()
+        entry = SlowQuery(
+            statement=statement[: self.max_statement_length],
+            parameters=parameters_shape(parameters, executemany),
+            duration_ms=round(seconds * 1000, 1),
+            route=trace.route if trace is not None else None,
+        )
+        self.entries.append(entry)
+        self.recorded += 1
+        logger.warning("Slow query %sms on %s: %.200s", entry.duration_ms, entry.route or "-", entry.statement)
+        if not executemany and self._should_explain(statement):
+            self._explain_task = asyncio.get_running_loop().create_task(
+                self._explain(entry, statement, parameters), name="slow-query-explain"
+            )
+
+    def _should_explain(self, statement: str) -> bool:
+        # One EXPLAIN at a time, so a burst of slow queries cannot pile more load onto the database.
+        if self._explain_task is not None and not self._explain_task.done():
+            return False
+        if random.random() >= self.explain_sample_rate:
+            return False
+        return bool(EXPLAINABLE_STATEMENT.match(statement)) and not UNSAFE_TO_EXPLAIN.search(statement)
+
+    def _get_explain_engine(self) -> AsyncEngine:
+        # A separate unpooled connection: EXPLAIN never takes a slot from the request pool, and its
+        # events are not recorded here, so it cannot trigger itself.
+        if self._explain_engine is None:
+            self._explain_engine = create_async_engine(
+                settings.database.url, poolclass=NullPool, connect_args={"ssl": False}
+            )
+        return self._explain_engine
+
+    async def _explain(self, entry: SlowQuery, statement: str, parameters: Any) -> None:
+        try:
+            async with self._get_explain_engine().connect() as conn:
+                # The transaction is rolled back, and the timeout bounds the extra load.
+                async with conn.begin() as transaction:
+                    await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.explain_timeout_ms)}")
+                    result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                    entry.plan = "\n".join(row[0] for row in result)
+                    await transaction.rollback()
+        except Exception as e:
+            logger.error("Error explaining slow query: %s", e)
+
+    def recent(self) -> list[SlowQueryResponse]:
+        return [
+            SlowQueryResponse(
+                statement=entry.statement,
+                parameters=entry.parameters,
+                duration_ms=entry.duration_ms,
+                route=entry.route,
+                recorded_at=entry.recorded_at,
+                plan=entry.plan,
+            )
+            for entry in reversed(self.entries)
+        ]
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    async def close(self) -> None:
+        if self._explain_engine is not None:
+            await self._explain_engine.dispose()
+            self._explain_engine = None
+
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.slow_query.threshold_ms,
+    max_size=settings.slow_query.buffer_size,
+    max_statement_length=settings.slow_query.max_statement_length,
+    explain_sample_rate=settings.slow_query.explain_sample_rate,
+    explain_timeout_ms=settings.slow_query.explain_timeout_ms,
+)
+
+
 SessionLocal = async_sessionmaker(
     bind=engine,
     class_=AsyncSession,
@@ -45,3 +275,36 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             raise
         finally:
             await session.close()
+
+
+async def release_connection(db: AsyncSession) -> None:
+    # Ends the open transaction so the pooled connection is returned before awaiting an upstream call.
+    # expire_on_commit=False keeps loaded objects usable; the next query checks out a connection again.
+    if db.in_transaction():
+        await db.commit()
+
+
+async def count_total(
+    db: AsyncSession, table: str, query: Select, signature: Hashable = (), approximate: bool = False
+) -> tuple[int, bool]:
+    # Returns (total, is_exact); approximate totals come from planner statistics in pg_class.
+    if approximate:
+        result = await db.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+        )
+        estimate = result.scalar_one_or_none()
+        # reltuples is -1 until the table has been vacuumed or analyzed.
+        if estimate is not None and estimate >= 0:
+            return int(estimate), False
+
+    key = (table, signature)
+    total = count_cache.get(key)
+    if total is None:
+        total_result = await db.execute(query)
+        total = total_result.scalar_one()
+        count_cache.set(key, total)
+    return total, True
+
+
+def invalidate_counts(table: str) -> None:
+    count_cache.invalidate_matching(lambda key: key[0] == table)
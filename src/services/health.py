@@ -0,0 +1,114 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from src.core.enums import ServiceStatus
+from src.core.logger import get_logger
+from src.core.settings import settings
+from src.models.common import ServiceHealthResponse
+from src.services.tw import get_timeweb_service
+from src.services.xui import get_xui_service
+
+logger = get_logger()
+
+# A probe returns the upstream version when it reports one.
+Probe = Callable[[], Awaitable[str | None]]
+
+
+@dataclass
+class HealthProber:
+    probes: dict[str, Probe]
+    interval_seconds: float
+    timeout_seconds: float
+    results: dict[str, ServiceHealthResponse] = field(default_factory=dict)
+    checked_at: float | None = None
+    _lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    _task: asyncio.Task | None = None
+
+    def __post_init__(self) -> None:
+        # Until the first round finishes every upstream is reported as not yet confirmed.
+        for name in self.probes:
+            self.results.setdefault(name, ServiceHealthResponse(status=ServiceStatus.WARNING))
+
+    async def _check(self, name: str, probe: Probe) -> None:
+        previous = self.results[name]
+        started = time.perf_counter()
+        try:
+            version = await asyncio.wait_for(probe(), timeout=self.timeout_seconds)
+        except Exception as e:
+            logger.error("Health check of %s failed: %r", name, e)
+            self.results[name] = previous.model_copy(
+                update={
+                    "status": ServiceStatus.ERROR,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "checked_at": datetime.now(),
+                }
+            )
+            return
+
+        now = datetime.now()
+        self.results[name] = ServiceHealthResponse(
+            status=ServiceStatus.OK,
+            version=version or previous.version,
+            latency_ms=round((time.perf_counter() - started) * 1000, 1),
+            checked_at=now,
+            last_success_at=now,
+        )
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self._check(name, probe) for name, probe in self.probes.items()))
+        self.checked_at = time.monotonic()
+
+    async def refresh_if_stale(self) -> None:
+        # Used when the background task is disabled; concurrent callers share one round of checks.
+        async with self._lock:
+            if self.checked_at is None or time.monotonic() - self.checked_at >= self.interval_seconds:
+                await self.check_all()
+
+    def snapshot(self) -> dict[str, ServiceHealthResponse]:
+        # A stalled prober must not keep reporting an old "ok".
+        stale_before = time.time() - 3 * (self.interval_seconds + self.timeout_seconds)
+        snapshot = {}
+        for name, health in self.results.items():
+            if health.status == ServiceStatus.OK and health.checked_at.timestamp() < stale_before:
+                health = health.model_copy(update={"status": ServiceStatus.WARNING})
+            snapshot[name] = health
+        return snapshot
+
+    async def _run(self) -> None:
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="health-prober")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def probe_xui() -> str | None:
+    xui_service = await get_xui_service()
+    return await xui_service.get_version()
+
+
+async def probe_timeweb() -> str | None:
+    timeweb_service = await get_timeweb_service()
+    await timeweb_service.get_status()
+    return None
+
+
+health_prober = HealthProber(
+    probes={"XUI-Panel": probe_xui, "TimeWeb-API": probe_timeweb},
+    interval_seconds=settings.health.interval_seconds,
+    timeout_seconds=settings.health.timeout_seconds,
+)
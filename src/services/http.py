@@ -0,0 +1,85 @@
+import time
+from collections.abc import Callable
+from importlib.util import find_spec
+
+from httpx import AsyncClient, AsyncHTTPTransport, Limits, Request, Response
+
+from src.core.logger import logger
+from src.core.metrics import upstream_request_duration
+from src.core.settings import settings
+from src.core.tracing import trace_span
+from src.models.common import HttpPoolStatsResponse
+
+
+def path_operation(request: Request) -> str:
+    return request.url.path
+
+
+class TracedTransport(AsyncHTTPTransport):
+    # Attributes upstream time to the current request trace under the service name.
+    # operation maps a request to a metrics label; it must drop identifiers such as emails.
+    def __init__(self, name: str, operation: Callable[[Request], str] = path_operation, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.name = name
+        self.operation = operation
+
+    async def handle_async_request(self, request: Request) -> Response:
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with trace_span(self.name):
+                response = await super().handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            if settings.app.metrics_enabled:
+                upstream_request_duration.observe(
+                    time.perf_counter() - started, self.name, self.operation(request), status
+                )
+
+
+def create_http_client(
+    *,
+    name: str,
+    operation: Callable[[Request], str] = path_operation,
+    timeout: float,
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+    http2: bool = False,
+) -> AsyncClient:
+    if http2 and find_spec("h2") is None:
+        logger.warning("HTTP/2 is enabled but the 'h2' package is not installed, falling back to HTTP/1.1")
+        http2 = False
+
+    return AsyncClient(
+        timeout=timeout,
+        transport=TracedTransport(
+            name,
+            operation,
+            http2=http2,
+            limits=Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        ),
+    )
+
+
+def get_http_pool_stats(client: AsyncClient) -> HttpPoolStatsResponse:
+    # httpx does not expose its pool, so read it from the default transport (httpcore.AsyncConnectionPool).
+    pool = getattr(client._transport, "_pool", None)
+    connections = list(getattr(pool, "connections", []))
+    requests = list(getattr(pool, "_requests", []))
+
+    idle = sum(1 for connection in connections if connection.is_idle())
+    queued = sum(1 for request in requests if request.is_queued())
+    return HttpPoolStatsResponse(
+        closed=client.is_closed,
+        connections=len(connections),
+        active_connections=len(connections) - idle,
+        idle_connections=idle,
+        active_requests=len(requests) - queued,
+        queued_requests=queued,
+    )
@@ -0,0 +1,362 @@
+import asyncio
+import os
+import random
+import socket
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import ARRAY, Integer, any_, bindparam, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from src.core.cache import close_cache, init_cache
+from src.core.enums import InvoiceStatus
+from src.core.logger import get_logger
+from src.core.metrics import invoice_worker_run_duration
+from src.core.settings import settings
+from src.models.tw import InvoiceResponse, InvoiceWorkerStatsResponse
+from src.models.xui import UpdateClientRequest
+from src.schemas.invoice_worker_state import InvoiceWorkerState
+from src.schemas.invoices import Invoice
+from src.schemas.users import User
+from src.services.db import SessionLocal, engine, release_connection, slow_query_log
+from src.services.tw import TimeWebService, get_timeweb_service
+from src.services.xui import XuiService, close_xui_client, get_xui_service, init_xui_client
+
+logger = get_logger()
+
+# The leader keeps its advisory lock on a dedicated connection, outside the request pool.
+lock_engine = create_async_engine(
+    settings.database.url,
+    poolclass=NullPool,
+    isolation_level="AUTOCOMMIT",
+    connect_args={"ssl": False},
+)
+
+
+@dataclass
+class InvoiceRun:
+    paid: list[InvoiceResponse]
+    provisioned: int
+    failed: int
+
+
+async def provision_paid_invoices(db: AsyncSession, xui_service: XuiService) -> tuple[list[int], list[int]]:
+    # Returns the provisioned and the failed invoice IDs.
+    result = await db.execute(
+        select(Invoice.id, User.username)
+        .outerjoin(User, Invoice.user_id == User.id)
+        .where(Invoice.status == InvoiceStatus.PAID, Invoice.provisioned_at.is_(None))
+    )
+    invoice_ids_by_username: dict[str | None, list[int]] = defaultdict(list)
+    for invoice_id, username in result.all():
+        invoice_ids_by_username[username].append(invoice_id)
+    if not invoice_ids_by_username:
+        return [], []
+
+    await release_connection(db)
+    # Invoices of deleted users have nothing to extend.
+    provisioned_ids = invoice_ids_by_username.pop(None, [])
+    failed_ids: list[int] = []
+    semaphore = asyncio.Semaphore(settings.worker.provision_concurrency)
+
+    async def extend(username: str) -> None:
+        async with semaphore:
+            await xui_service.update_client_by_email(
+                username,
+                UpdateClientRequest(expiry_time_days=settings.app.default_expiry_time_days, enable=True),
+            )
+            await xui_service.reset_client_traffic_by_email(username)
+
+    usernames = list(invoice_ids_by_username)
+    results = await asyncio.gather(*(extend(username) for username in usernames), return_exceptions=True)
+    for username, error in zip(usernames, results):
+        if isinstance(error, BaseException):
+            logger.error("Error provisioning paid invoices for %s: %s", username, error)
+            failed_ids.extend(invoice_ids_by_username[username])
+        else:
+            provisioned_ids.extend(invoice_ids_by_username[username])
+
+    if provisioned_ids:
+        await db.execute(
+            update(Invoice)
+            .where(Invoice.id == any_(bindparam("invoice_ids", provisioned_ids, type_=ARRAY(Integer))))
+            .values(provisioned_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+    return provisioned_ids, failed_ids
+
+
+async def run_invoices(
+    db: AsyncSession,
+    tw_service: TimeWebService,
+    xui_service: XuiService,
+    full_resync: bool = False,
+) -> InvoiceRun:
+    payed_invoices = await tw_service.check_invoices(db, full_resync=full_resync)
+    # Also retries invoices whose provisioning failed on an earlier run.
+    provisioned_ids, failed_ids = await provision_paid_invoices(db, xui_service)
+    return InvoiceRun(paid=payed_invoices, provisioned=len(provisioned_ids), failed=len(failed_ids))
+
+
+async def process_invoices(
+    db: AsyncSession,
+    tw_service: TimeWebService,
+    xui_service: XuiService,
+    full_resync: bool = False,
+) -> list[InvoiceResponse]:
+    run = await run_invoices(db, tw_service, xui_service, full_resync=full_resync)
+    return run.paid
+
+
+@dataclass
+class InvoiceWorker:
+    interval_seconds: float
+    jitter_seconds: float
+    max_backoff_seconds: float
+    lock_key: int
+    runs: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    last_run_at: datetime | None = None
+    last_run_duration_seconds: float | None = None
+    last_success_at: datetime | None = None
+    last_error: str | None = None
+    last_paid: int = 0
+    last_provisioned: int = 0
+    last_failed: int = 0
+    name: str = "invoice-worker"
+    # Identifies the leader in the persisted state.
+    leader_id: str = field(default_factory=lambda: f"{socket.gethostname()}:{os.getpid()}")
+    running: bool = False
+    _lock_conn: AsyncConnection | None = None
+    _task: asyncio.Task | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_conn is not None
+
+    async def _acquire_leadership(self) -> bool:
+        if self._lock_conn is not None:
+            try:
+                await self._lock_conn.execute(text("SELECT 1"))
+                return True
+            except Exception as e:
+                logger.error("Invoice worker lost its lock connection: %s", e)
+                await self._release_leadership()
+
+        conn = await lock_engine.connect()
+        try:
+            result = await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": self.lock_key})
+            acquired = bool(result.scalar_one())
+        except Exception:
+            await conn.close()
+            raise
+        if not acquired:
+            await conn.close()
+            return False
+        self._lock_conn = conn
+        logger.info("Invoice worker acquired leadership")
+        return True
+
+    async def _release_leadership(self) -> None:
+        if self._lock_conn is None:
+            return
+        conn, self._lock_conn = self._lock_conn, None
+        try:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.lock_key})
+        except Exception as e:
+            logger.error("Error releasing invoice worker lock: %s", e)
+        finally:
+            await conn.close()
+
+    async def run_once(self) -> InvoiceRun:
+        xui_service = await get_xui_service()
+        tw_service = await get_timeweb_service()
+        async with SessionLocal() as db:
+            return await run_invoices(db, tw_service, xui_service)
+
+    async def _tick(self) -> None:
+        if not await self._acquire_leadership():
+            logger.debug("Invoice worker is not the leader, skipping run")
+            return
+
+        started = time.perf_counter()
+        self.last_run_at = datetime.now()
+        self.runs += 1
+        result = "error"
+        self.last_paid = self.last_provisioned = self.last_failed = 0
+        try:
+            run = await self.run_once()
+        except Exception as e:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(e)
+            logger.error("Invoice worker run failed: %s", e)
+        else:
+            result = "ok"
+            self.consecutive_failures = 0
+            self.last_error = None
+            self.last_success_at = datetime.now()
+            self.last_paid, self.last_provisioned, self.last_failed = len(run.paid), run.provisioned, run.failed
+            if run.paid:
+                logger.info("Invoice worker processed %s paid invoices", len(run.paid))
+        finally:
+            duration = time.perf_counter() - started
+            self.last_run_duration_seconds = round(duration, 3)
+            invoice_worker_run_duration.observe(duration, result)
+        await self._save_state(succeeded=result == "ok")
+
+    async def _save_state(self, succeeded: bool) -> None:
+        # Totals are accumulated in SQL so they survive restarts and leader changes.
+        values = {
+            "leader": self.leader_id,
+            "last_run_at": self.last_run_at,
+            "last_run_duration_seconds": self.last_run_duration_seconds,
+            "last_success_at": self.last_success_at if succeeded else None,
+            "last_error": self.last_error,
+            "last_paid": self.last_paid,
+            "last_provisioned": self.last_provisioned,
+            "last_failed": self.last_failed,
+            "updated_at": datetime.now(),
+        }
+        statement = insert(InvoiceWorkerState).values(
+            name=self.name,
+            runs=1,
+            failures=0 if succeeded else 1,
+            consecutive_failures=0 if succeeded else 1,
+            **values,
+        )
+        state = InvoiceWorkerState
+        statement = statement.on_conflict_do_update(
+            index_elements=[state.name],
+            set_={
+                **values,
+                "runs": state.runs + 1,
+                "failures": state.failures + (0 if succeeded else 1),
+                "consecutive_failures": 0 if succeeded else state.consecutive_failures + 1,
+                "last_success_at": func.coalesce(statement.excluded.last_success_at, state.last_success_at),
+            },
+        )
+        try:
+            async with SessionLocal() as db:
+                await db.execute(statement)
+                await db.commit()
+        except Exception as e:
+            logger.error("Error saving invoice worker state: %s", e)
+
+    def _delay(self, consecutive_failures: int) -> float:
+        delay = self.interval_seconds
+        if consecutive_failures:
+            delay = min(self.max_backoff_seconds, delay * 2**consecutive_failures)
+        return delay
+
+    def _next_delay(self) -> float:
+        return self._delay(self.consecutive_failures) + random.uniform(0, self.jitter_seconds)
+
+    async def run(self) -> None:
+        logger.info("Invoice worker started (interval=%ss)", self.interval_seconds)
+        self.running = True
+        try:
+            while True:
+                try:
+                    await self._tick()
+                except Exception as e:
+                    self.consecutive_failures += 1
+                    logger.error("Invoice worker could not acquire its lock: %s", e)
+                await asyncio.sleep(self._next_delay())
+        finally:
+            self.running = False
+            await self._release_leadership()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(), name="invoice-worker")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await lock_engine.dispose()
+
+    def stats(self) -> InvoiceWorkerStatsResponse:
+        # This process only.
+        return InvoiceWorkerStatsResponse(
+            running=self.running,
+            leader=self.leader_id if self.is_leader else None,
+            runs=self.runs,
+            failures=self.failures,
+            consecutive_failures=self.consecutive_failures,
+            last_run_at=self.last_run_at,
+            last_run_duration_seconds=self.last_run_duration_seconds,
+            last_success_at=self.last_success_at,
+            last_error=self.last_error,
+            last_paid=self.last_paid,
+            last_provisioned=self.last_provisioned,
+            last_failed=self.last_failed,
+        )
+
+    async def load_stats(self, db: AsyncSession) -> InvoiceWorkerStatsResponse:
+        # The worker usually runs in its own process; the leader persists its state after each run.
+        state = await db.get(InvoiceWorkerState, self.name)
+        await release_connection(db)
+        if state is None:
+            return InvoiceWorkerStatsResponse(running=False)
+        # The next run is due after the (backed-off) delay; allow one missed run before calling it stopped.
+        expected = 2 * (self._delay(state.consecutive_failures) + self.jitter_seconds) + state.last_run_duration_seconds
+        return InvoiceWorkerStatsResponse(
+            running=(datetime.now() - state.last_run_at).total_seconds() <= expected,
+            leader=state.leader,
+            runs=state.runs,
+            failures=state.failures,
+            consecutive_failures=state.consecutive_failures,
+            last_run_at=state.last_run_at,
+            last_run_duration_seconds=state.last_run_duration_seconds,
+            last_success_at=state.last_success_at,
+            last_error=state.last_error,
+            last_paid=state.last_paid,
+            last_provisioned=state.last_provisioned,
+            last_failed=state.last_failed,
+        )
+
+
+invoice_worker = InvoiceWorker(
+    interval_seconds=settings.worker.interval_seconds,
+    jitter_seconds=settings.worker.jitter_seconds,
+    max_backoff_seconds=settings.worker.max_backoff_seconds,
+    lock_key=settings.worker.lock_key,
+)
+
+
+async def main() -> None:
+    # Invalidations from this process must reach the API's shared response cache.
+    await init_cache(engine)
+    init_xui_client()
+    metrics_server = None
+    if settings.app.metrics_enabled and settings.worker.metrics_port:
+        # Imported here: the metrics module reads this one's invoice_worker.
+        from src.services.metrics import start_metrics_server
+
+        metrics_server = await start_metrics_server(settings.worker.metrics_host, settings.worker.metrics_port)
+    try:
+        await invoice_worker.run()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        await lock_engine.dispose()
+        await close_xui_client()
+        await close_cache()
+        await slow_query_log.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
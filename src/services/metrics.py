@@ -0,0 +1,145 @@
+import asyncio
+import hmac
+from collections.abc import Iterable
+
+from src.core.cache import TTLCache, count_cache, registration_code_cache, response_flight, user_identity_cache
+from src.core.logger import get_logger
+from src.core.metrics import CONTENT_TYPE, CallbackMetric, Sample, registry
+from src.core.settings import settings
+from src.services.db import get_pool_stats
+from src.services.http import get_http_pool_stats
+from src.services import xui
+from src.services.invoice_worker import invoice_worker
+from src.services.xui import xui_inbounds_cache
+from src.services.xui_snapshot import xui_snapshot
+
+logger = get_logger()
+
+CACHES: dict[str, TTLCache] = {
+    "auth": user_identity_cache,
+    "counts": count_cache,
+    "registration_codes": registration_code_cache,
+}
+
+
+def _cache_samples(field: str) -> Iterable[Sample]:
+    for name, cache in CACHES.items():
+        yield (name,), getattr(cache.stats(), field)
+    yield ("xui_inbounds",), getattr(xui_inbounds_cache.stats(), field)
+    if field in ("hits", "misses"):
+        yield ("xui_snapshot",), getattr(xui_snapshot, field)
+
+
+def _db_pool_samples(*fields: str) -> Iterable[Sample]:
+    stats = get_pool_stats()
+    for field in fields:
+        yield (field,), getattr(stats, field)
+
+
+def _xui_pool_samples() -> Iterable[Sample]:
+    # A scrape must not open the client; it exists once the lifespan (or the worker) has started it.
+    if xui._xui_client is None:
+        return
+    stats = get_http_pool_stats(xui._xui_client)
+    yield ("active",), stats.active_connections
+    yield ("idle",), stats.idle_connections
+    yield ("queued_requests",), stats.queued_requests
+
+
+def _worker_samples() -> Iterable[Sample]:
+    # Only the process running the worker reports it; a separate worker process serves its own metrics.
+    if not invoice_worker.running:
+        return
+    stats = invoice_worker.stats()
+    yield ("leader",), int(stats.leader is not None)
+    yield ("consecutive_failures",), stats.consecutive_failures
+
+
+for metric in (
+    CallbackMetric(
+        "frg_db_pool_connections",
+        "Database pool connections by state.",
+        "gauge",
+        lambda: _db_pool_samples("checked_out", "idle", "overflow"),
+        ("state",),
+    ),
+    CallbackMetric(
+        "frg_db_pool_events_total",
+        "Database pool events since start.",
+        "counter",
+        lambda: _db_pool_samples("connects", "checkouts", "invalidations", "timeouts", "waits"),
+        ("event",),
+    ),
+    CallbackMetric(
+        "frg_db_pool_wait_seconds_total",
+        "Time spent waiting for a database connection.",
+        "counter",
+        lambda: [((), get_pool_stats().wait_seconds_total)],
+    ),
+    CallbackMetric(
+        "frg_xui_pool_connections",
+        "XUI HTTP client pool connections by state.",
+        "gauge",
+        _xui_pool_samples,
+        ("state",),
+    ),
+    CallbackMetric(
+        "frg_cache_hits_total", "In-process cache hits.", "counter", lambda: _cache_samples("hits"), ("cache",)
+    ),
+    CallbackMetric(
+        "frg_cache_misses_total", "In-process cache misses.", "counter", lambda: _cache_samples("misses"), ("cache",)
+    ),
+    CallbackMetric("frg_cache_entries", "In-process cache size.", "gauge", lambda: _cache_samples("size"), ("cache",)),
+    CallbackMetric(
+        "frg_response_cache_coalesced_total",
+        "Response cache misses that waited for a concurrent computation.",
+        "counter",
+        lambda: [((), response_flight.coalesced)],
+    ),
+    CallbackMetric("frg_invoice_worker_state", "Invoice worker state.", "gauge", _worker_samples, ("state",)),
+):
+    registry.register(metric)
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+def _http_response(status: str, body: bytes, content_type: str = "text/plain; charset=utf-8") -> bytes:
+    head = (
+        f"HTTP/1.1 {status}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    return head.encode() + body
+
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        headers = {}
+        while (line := await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        method, path = ([*request_line.decode("latin-1").split(), "", ""])[:2]
+        expected = f"Bearer {settings.app.superuser_token}"
+        if method != "GET" or path.split("?")[0] != "/metrics":
+            response = _http_response("404 Not Found", b"Not Found")
+        elif not hmac.compare_digest(headers.get("authorization", "").encode(), expected.encode()):
+            response = _http_response("401 Unauthorized", b"Unauthorized")
+        else:
+            response = _http_response("200 OK", render_metrics().encode(), CONTENT_TYPE)
+        writer.write(response)
+        await writer.drain()
+    except Exception as e:
+        logger.error("Error serving metrics: %s", e)
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> asyncio.Server:
+    # For processes without the API (the invoice worker): GET /metrics with the superuser bearer token.
+    server = await asyncio.start_server(_serve_metrics, host, port)
+    logger.info("Serving metrics on %s:%s/metrics", host, port)
+    return server
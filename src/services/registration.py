@@ -4,9 +4,10 @@ from datetime import datetime, timedelta
 from math import ceil
 
 from fastapi import Depends, HTTPException
-from sqlalchemy import func, select
+from sqlalchemy import func, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.cache import MISSING, invalidate_tags, registration_code_cache
 from src.core.enums import Role
 from src.core.logger import get_logger
 from src.core.settings import settings
@@ -20,6 +21,7 @@ from src.models.registration import (
 from src.models.users import CreateUserRequest
 from src.schemas.registration_codes import RegistrationCode
 from src.schemas.users import User
+from src.services.db import count_total, invalidate_counts
 from src.services.users import UserService, get_user_service
 
 logger = get_logger()
@@ -32,39 +34,48 @@ class RegistrationService:
     def _is_code_valid(self, registration_code: RegistrationCode) -> bool:
         return registration_code.enable and registration_code.expires_at > datetime.now()
 
-    def _has_registration_slots(self, registration_code: RegistrationCode, registrations_count: int) -> bool:
+    def _has_registration_slots(self, registration_code: RegistrationCode) -> bool:
         if registration_code.max_registrations == 0:
             return True
-        return registrations_count < registration_code.max_registrations
+        return registration_code.registrations_count < registration_code.max_registrations
 
-    async def _count_registrations(self, db: AsyncSession, code_id: int) -> int:
+    async def _reserve_registration_slot(self, db: AsyncSession, code_id: int) -> bool:
+        # The conditional UPDATE takes the row lock, so concurrent sign-ups cannot over-admit a code.
         result = await db.execute(
-            select(func.count()).select_from(User).where(User.registration_code_id == code_id)
+            update(RegistrationCode)
+            .where(
+                RegistrationCode.id == code_id,
+                RegistrationCode.enable.is_(True),
+                RegistrationCode.expires_at > datetime.now(),
+                or_(
+                    RegistrationCode.max_registrations == 0,
+                    RegistrationCode.registrations_count < RegistrationCode.max_registrations,
+                ),
+            )
+            .values(registrations_count=RegistrationCode.registrations_count + 1)
+            .returning(RegistrationCode.registrations_count)
+            .execution_options(synchronize_session=False)
         )
-        return result.scalar_one()
-
-    async def _registration_counts_by_code_ids(
-        self, db: AsyncSession, code_ids: list[int]
-    ) -> dict[int, int]:
-        if not code_ids:
-            return {}
-
-        result = await db.execute(
-            select(User.registration_code_id, func.count())
-            .where(User.registration_code_id.in_(code_ids))
-            .group_by(User.registration_code_id)
+        reserved = result.scalar_one_or_none() is not None
+        await db.commit()
+        return reserved
+
+    async def _release_registration_slot(self, db: AsyncSession, code_id: int) -> None:
+        await db.execute(
+            update(RegistrationCode)
+            .where(RegistrationCode.id == code_id, RegistrationCode.registrations_count > 0)
+            .values(registrations_count=RegistrationCode.registrations_count - 1)
+            .execution_options(synchronize_session=False)
         )
-        return {code_id: count for code_id, count in result.all()}
+        await db.commit()
 
-    def _to_code_response(
-        self, registration_code: RegistrationCode, registrations_count: int
-    ) -> RegistrationCodeResponse:
+    def _to_code_response(self, registration_code: RegistrationCode) -> RegistrationCodeResponse:
         return RegistrationCodeResponse(
             id=registration_code.id,
             code=registration_code.code,
             expires_at=registration_code.expires_at,
             max_registrations=registration_code.max_registrations,
-            registrations_count=registrations_count,
+            registrations_count=registration_code.registrations_count,
             enable=registration_code.enable,
             created_by_id=registration_code.created_by_id,
             created_at=registration_code.created_at,
@@ -72,8 +83,18 @@ class RegistrationService:
         )
 
     async def _get_code_by_value(self, db: AsyncSession, code: str) -> RegistrationCode | None:
+        # Misses are cached too, so repeated junk codes never reach the database.
+        cached = registration_code_cache.get(code, MISSING)
+        if cached is not MISSING:
+            return cached
+
         result = await db.execute(select(RegistrationCode).where(RegistrationCode.code == code))
-        return result.scalar_one_or_none()
+        registration_code = result.scalar_one_or_none()
+        if registration_code is not None:
+            # Cached instances are shared between requests, so they must not stay bound to this session.
+            db.expunge(registration_code)
+        registration_code_cache.set(code, registration_code)
+        return registration_code
 
     async def validate_code(self, db: AsyncSession, code: str) -> RegisterValidationResponse:
         registration_code = await self._get_code_by_value(db, code)
@@ -84,10 +105,7 @@ class RegistrationService:
                 registration_expiry_days=settings.app.registration_expiry_time_days,
             )
 
-        registrations_count = await self._count_registrations(db, registration_code.id)
-        valid = self._is_code_valid(registration_code) and self._has_registration_slots(
-            registration_code, registrations_count
-        )
+        valid = self._is_code_valid(registration_code) and self._has_registration_slots(registration_code)
         return RegisterValidationResponse(
             valid=valid,
             expires_at=registration_code.expires_at,
@@ -103,8 +121,7 @@ class RegistrationService:
         if not self._is_code_valid(registration_code):
             raise HTTPException(status_code=400, detail="Invalid or expired registration code")
 
-        registrations_count = await self._count_registrations(db, registration_code.id)
-        if not self._has_registration_slots(registration_code, registrations_count):
+        if not self._has_registration_slots(registration_code):
             raise HTTPException(status_code=400, detail="Registration limit reached for this code")
 
         username = payload.username
@@ -113,23 +130,29 @@ class RegistrationService:
         if existing_user is not None:
             raise HTTPException(status_code=400, detail="Username already taken")
 
-        token = await self.user_service.create(
-            db,
-            CreateUserRequest(
-                username=username,
-                role=Role.USER,
-                mark=payload.mark,
-                expiry_time_days=settings.app.registration_expiry_time_days,
-                limit_ips=settings.app.default_limit_ips,
-            ),
-            registration_code_id=registration_code.id,
-        )
-
-        user = await self.user_service.get_by_username(db, username)
-        if user is None:
-            raise HTTPException(status_code=500, detail="Failed to create user")
+        if not await self._reserve_registration_slot(db, registration_code.id):
+            raise HTTPException(status_code=400, detail="Registration limit reached for this code")
 
-        logger.debug(f"User {user.id} registered with code {registration_code.code}")
+        try:
+            token = await self.user_service.create(
+                db,
+                CreateUserRequest(
+                    username=username,
+                    role=Role.USER,
+                    mark=payload.mark,
+                    expiry_time_days=settings.app.registration_expiry_time_days,
+                    limit_ips=settings.app.default_limit_ips,
+                ),
+                registration_code_id=registration_code.id,
+            )
+        except Exception:
+            await db.rollback()
+            await self._release_registration_slot(db, registration_code.id)
+            raise
+
+        registration_code_cache.invalidate(registration_code.code)
+        await invalidate_tags("codes")
+        logger.debug("User %s registered with code %s", username, registration_code.code)
         return token
 
     async def create_code(
@@ -143,8 +166,11 @@ class RegistrationService:
         )
         db.add(registration_code)
         await db.commit()
+        registration_code_cache.invalidate(registration_code.code)
+        invalidate_counts("registration_codes")
+        await invalidate_tags("codes")
         await db.refresh(registration_code)
-        return self._to_code_response(registration_code, 0)
+        return self._to_code_response(registration_code)
 
     async def disable_code(self, db: AsyncSession, id: int) -> RegistrationCodeResponse:
         result = await db.execute(select(RegistrationCode).where(RegistrationCode.id == id))
@@ -156,9 +182,10 @@ class RegistrationService:
 
         registration_code.enable = False
         await db.commit()
+        registration_code_cache.invalidate(registration_code.code)
+        await invalidate_tags("codes")
         await db.refresh(registration_code)
-        registrations_count = await self._count_registrations(db, registration_code.id)
-        return self._to_code_response(registration_code, registrations_count)
+        return self._to_code_response(registration_code)
 
     async def extend_code(
         self, db: AsyncSession, id: int, payload: ExtendRegistrationCodeRequest
@@ -171,26 +198,30 @@ class RegistrationService:
         base = max(registration_code.expires_at, datetime.now())
         registration_code.expires_at = base + timedelta(days=payload.extend_days)
         await db.commit()
+        registration_code_cache.invalidate(registration_code.code)
+        await invalidate_tags("codes")
         await db.refresh(registration_code)
-        registrations_count = await self._count_registrations(db, registration_code.id)
-        return self._to_code_response(registration_code, registrations_count)
+        return self._to_code_response(registration_code)
 
     async def list_codes(
-        self, db: AsyncSession, page: int = 1, limit: int = 20
-    ) -> tuple[list[RegistrationCodeResponse], int, int]:
-        total_result = await db.execute(select(func.count()).select_from(RegistrationCode))
-        total = total_result.scalar_one()
+        self, db: AsyncSession, page: int = 1, limit: int = 20, approximate_total: bool = False
+    ) -> tuple[list[RegistrationCodeResponse], int, int, bool]:
+        total, total_exact = await count_total(
+            db,
+            "registration_codes",
+            select(func.count()).select_from(RegistrationCode),
+            approximate=approximate_total,
+        )
         pages = max(1, ceil(total / limit)) if total else 1
-        page = min(max(page, 1), pages)
+        if total_exact:
+            page = min(max(page, 1), pages)
         offset = (page - 1) * limit
 
         result = await db.execute(
             select(RegistrationCode).order_by(RegistrationCode.created_at.desc()).offset(offset).limit(limit)
         )
-        codes = list(result.scalars().all())
-        counts = await self._registration_counts_by_code_ids(db, [code.id for code in codes])
-        items = [self._to_code_response(code, counts.get(code.id, 0)) for code in codes]
-        return items, total, page
+        items = [self._to_code_response(code) for code in result.scalars().all()]
+        return items, total, page, total_exact
 
 
 def get_registration_service(
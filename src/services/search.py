@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.models.search import SearchResponse
+from src.services.tw import TimeWebService, get_timeweb_service
+from src.services.users import UserService, get_user_service
+
+
+@dataclass
+class SearchService:
+    user_service: UserService
+    tw_service: TimeWebService
+
+    async def search(self, db: AsyncSession, term: str, limit: int = 10) -> SearchResponse:
+        term = term.strip()
+        users = await self.user_service.search_users(db, term, limit)
+        invoices = await self.tw_service.search_invoices(
+            db,
+            user_ids=[user.id for user in users],
+            invoice_id=int(term) if term.isdigit() else None,
+            limit=limit,
+        )
+        return SearchResponse(users=users, invoices=invoices)
+
+
+def get_search_service(
+    user_service: UserService = Depends(get_user_service),
+    tw_service: TimeWebService = Depends(get_timeweb_service),
+) -> SearchService:
+    return SearchService(user_service=user_service, tw_service=tw_service)
@@ -1,18 +1,49 @@
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from math import ceil
 
 from fastapi import HTTPException
 from httpx import AsyncClient
-from sqlalchemy import case, func, select
+from pydantic import TypeAdapter
+from sqlalchemy import (
+    ARRAY,
+    Integer,
+    Select,
+    and_,
+    any_,
+    bindparam,
+    case,
+    func,
+    literal_column,
+    or_,
+    select,
+    tuple_,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.cache import invalidate_tags, user_tag
 from src.core.enums import InvoiceStatus, ServiceStatus
 from src.core.logger import logger
 from src.core.settings import settings
+from src.models.common import decode_cursor, encode_cursor
 from src.models.tw import AdminInvoiceResponse, FinancesResponse, InvoiceResponse, PaymentResponse
-from src.schemas.invoices import Invoice
+from src.schemas.invoices import INVOICE_STATUS_RANK_SQL, Invoice
+from src.schemas.payment_cursors import PaymentCursor
 from src.schemas.users import User
+from src.services.db import count_total, invalidate_counts, release_connection
+from src.services.http import TracedTransport
+
+PAYMENT_CURSOR_SOURCE = "timeweb"
+PAYMENT_DATE = TypeAdapter(datetime)
+# Literal SQL rather than case(): bound parameters would keep the planner from matching ix_invoices_status_rank.
+INVOICE_STATUS_RANK = literal_column(f"({INVOICE_STATUS_RANK_SQL})", Integer)
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
 
 
 @dataclass
@@ -27,18 +58,20 @@ class TimeWebService:
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json",
         }
-        response = await AsyncClient(timeout=self.timeout).get(url, headers=headers)
+        async with AsyncClient(timeout=self.timeout, transport=TracedTransport("timeweb")) as client:
+            response = await client.get(url, headers=headers)
         response.raise_for_status()
         return ServiceStatus.OK
 
     async def get_finances(self) -> FinancesResponse:
         url = f"{self.base_url}/account/finances"
-        logger.debug(f"tw token: {self.token[:10]}...")
+        logger.debug("tw token: %s...", self.token[:10])
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json",
         }
-        response = await AsyncClient(timeout=self.timeout).get(url, headers=headers)
+        async with AsyncClient(timeout=self.timeout, transport=TracedTransport("timeweb")) as client:
+            response = await client.get(url, headers=headers)
         response.raise_for_status()
         data = response.json()
         return FinancesResponse(
@@ -62,6 +95,7 @@ class TimeWebService:
         if invoice is not None:
             return InvoiceResponse.model_validate(invoice)
 
+        await release_connection(db)
         url = f"{settings.timeweb.portal_url}/invoices"
         headers = {
             "Authorization": f"Bearer {self.token}",
@@ -81,11 +115,8 @@ class TimeWebService:
             },
             "items": [],
         }
-        response = await AsyncClient(timeout=self.timeout).post(
-            url,
-            headers=headers,
-            json=payload,
-        )
+        async with AsyncClient(timeout=self.timeout, transport=TracedTransport("timeweb")) as client:
+            response = await client.post(url, headers=headers, json=payload)
         response.raise_for_status()
         data = response.json()
 
@@ -99,51 +130,119 @@ class TimeWebService:
         )
         db.add(invoice)
         await db.commit()
+        invalidate_counts("invoices")
+        await invalidate_tags("invoices", user_tag(user_id))
         return InvoiceResponse.model_validate(invoice)
 
-    async def get_payments(self) -> list[PaymentResponse]:
-        url = f"{settings.timeweb.api_url}/accounts/payments?limit=1000&offset=0&locale=ru"
+    async def get_payments(self, since: datetime | None = None) -> list[PaymentResponse]:
+        payments, _ = await self.scan_payments(since)
+        return payments
+
+    async def scan_payments(self, since: datetime | None = None) -> tuple[list[PaymentResponse], bool]:
+        # Returns (incoming payments, complete); complete is False when payments_max_pages ran out first.
+        url = f"{settings.timeweb.api_url}/accounts/payments"
         headers = {
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json",
             **settings.timeweb.default_headers,
         }
-        response = await AsyncClient(timeout=self.timeout).get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        payments = data["payments"]
-        return [PaymentResponse.model_validate(payment) for payment in payments if payment["type"] == "incom"]
+        page_size = settings.timeweb.payments_page_size
+        payments: list[PaymentResponse] = []
+        async with AsyncClient(timeout=self.timeout, transport=TracedTransport("timeweb")) as client:
+            for page in range(settings.timeweb.payments_max_pages):
+                params = {"limit": page_size, "offset": page * page_size, "locale": "ru"}
+                response = await client.get(url, headers=headers, params=params)
+                response.raise_for_status()
+                page_payments = response.json()["payments"]
 
-    async def check_invoices(self, db: AsyncSession) -> list[InvoiceResponse]:
-        payments = await self.get_payments()
-        logger.debug(f"Found payments: {payments}")
-        payed_invoices = []
+                # Payments come newest first; payments on the cursor date are re-read, which is safe
+                # because reconciliation only touches PENDING/PROCESSING invoices. Only incoming rows are
+                # validated: charges and refunds may have no invoice.
+                reached_known = False
+                for payment in page_payments:
+                    if since is not None and _naive_utc(PAYMENT_DATE.validate_python(payment["date"])) < since:
+                        reached_known = True
+                    elif payment["type"] == "incom":
+                        payments.append(PaymentResponse.model_validate(payment))
+                if reached_known or len(page_payments) < page_size:
+                    return payments, True
+        return payments, False
 
-        db_invoices = await db.execute(
-            select(Invoice).where(
-                Invoice.status == InvoiceStatus.PENDING, Invoice.created_at < datetime.now() - timedelta(hours=1)
+    async def _get_payment_cursor(self, db: AsyncSession) -> PaymentCursor | None:
+        return await db.get(PaymentCursor, PAYMENT_CURSOR_SOURCE)
+
+    async def _advance_payment_cursor(
+        self, db: AsyncSession, cursor: PaymentCursor | None, payments: list[PaymentResponse]
+    ) -> None:
+        if not payments:
+            return
+        newest = max(payments, key=lambda payment: _naive_utc(payment.date))
+        newest_date = _naive_utc(newest.date)
+        if cursor is None:
+            db.add(
+                PaymentCursor(
+                    source=PAYMENT_CURSOR_SOURCE,
+                    last_payment_date=newest_date,
+                    last_invoice_id=newest.invoice,
+                )
             )
-        )
-        db_invoices = db_invoices.scalars().all()
-        for invoice in db_invoices:
-            invoice.status = InvoiceStatus.CANCELLED
-            logger.debug(f"Set invoice {invoice.invoice_id} status to CANCELLED")
-            await db.commit()
-
-        for payment in payments:
-            invoice = await db.execute(
-                select(Invoice).where(
-                    Invoice.invoice_id == payment.invoice,
+        elif newest_date >= cursor.last_payment_date:
+            cursor.last_payment_date = newest_date
+            cursor.last_invoice_id = newest.invoice
+
+    async def check_invoices(self, db: AsyncSession, full_resync: bool = False) -> list[InvoiceResponse]:
+        cursor = await self._get_payment_cursor(db)
+        since = None if full_resync or cursor is None else cursor.last_payment_date
+        await release_connection(db)
+        payments, complete = await self.scan_payments(since=since)
+        logger.debug("Found payments: %s", payments)
+        if not complete:
+            # Moving the cursor past payments that were never read would skip them for good.
+            logger.warning(
+                "Payment scan stopped after %s pages before reaching the cursor; cursor left unchanged",
+                settings.timeweb.payments_max_pages,
+            )
+        invoice_ids = sorted({payment.invoice for payment in payments})
+
+        # Paid invoices are settled before stale ones are cancelled, so a late payment is never lost.
+        payed_invoices: list[Invoice] = []
+        if invoice_ids:
+            result = await db.execute(
+                update(Invoice)
+                .where(
+                    Invoice.invoice_id == any_(bindparam("invoice_ids", invoice_ids, type_=ARRAY(Integer))),
                     Invoice.status.in_((InvoiceStatus.PENDING, InvoiceStatus.PROCESSING)),
                 )
+                .values(status=InvoiceStatus.PAID)
+                .returning(Invoice)
+                .execution_options(synchronize_session=False)
             )
-            invoice = invoice.scalar_one_or_none()
-            if invoice is not None:
-                invoice.status = InvoiceStatus.PAID
-                logger.debug(f"Set invoice {invoice.invoice_id} status to PAID")
-                await db.commit()
-                payed_invoices.append(invoice)
+            payed_invoices = list(result.scalars().all())
+
+        result = await db.execute(
+            update(Invoice)
+            .where(
+                Invoice.status == InvoiceStatus.PENDING,
+                Invoice.created_at < datetime.now() - timedelta(hours=1),
+            )
+            .values(status=InvoiceStatus.CANCELLED)
+            .returning(Invoice.invoice_id, Invoice.user_id)
+            .execution_options(synchronize_session=False)
+        )
+        cancelled = result.all()
+        cancelled_ids = [invoice_id for invoice_id, _ in cancelled]
+        if complete:
+            await self._advance_payment_cursor(db, cursor, payments)
+        await db.commit()
+
+        changed_user_ids = {invoice.user_id for invoice in payed_invoices} | {user_id for _, user_id in cancelled}
+        if changed_user_ids:
+            await invalidate_tags("invoices", *(user_tag(user_id) for user_id in sorted(changed_user_ids)))
 
+        if payed_invoices:
+            logger.debug("Set invoices %s status to PAID", [invoice.invoice_id for invoice in payed_invoices])
+        if cancelled_ids:
+            logger.debug("Set invoices %s status to CANCELLED", cancelled_ids)
         return [InvoiceResponse.model_validate(invoice) for invoice in payed_invoices]
 
     async def mark_invoice_processing(
@@ -167,8 +266,9 @@ class TimeWebService:
 
         invoice.status = InvoiceStatus.PROCESSING
         await db.commit()
+        await invalidate_tags("invoices", user_tag(invoice.user_id))
         await db.refresh(invoice)
-        logger.debug(f"Set invoice {invoice.invoice_id} status to PROCESSING")
+        logger.debug("Set invoice %s status to PROCESSING", invoice.invoice_id)
         return InvoiceResponse.model_validate(invoice)
 
     async def cancel_invoice(self, db: AsyncSession, id: int) -> InvoiceResponse:
@@ -181,20 +281,18 @@ class TimeWebService:
 
         invoice.status = InvoiceStatus.CANCELLED
         await db.commit()
+        await invalidate_tags("invoices", user_tag(invoice.user_id))
         await db.refresh(invoice)
-        logger.debug(f"Set invoice {invoice.invoice_id} status to CANCELLED")
+        logger.debug("Set invoice %s status to CANCELLED", invoice.invoice_id)
         return InvoiceResponse.model_validate(invoice)
 
-    async def list_invoices(
+    def _invoice_filters(
         self,
-        db: AsyncSession,
-        page: int = 1,
-        limit: int = 20,
-        user_id: int | None = None,
-        invoice_id: int | None = None,
-        invoice_db_id: int | None = None,
-        username: str | None = None,
-    ) -> tuple[list[AdminInvoiceResponse], int, int]:
+        user_id: int | None,
+        invoice_id: int | None,
+        invoice_db_id: int | None,
+        username: str | None,
+    ) -> list:
         filters = []
         if user_id is not None:
             filters.append(Invoice.user_id == user_id)
@@ -204,50 +302,159 @@ class TimeWebService:
             filters.append(Invoice.id == invoice_db_id)
         if username is not None:
             filters.append(User.username.ilike(f"%{username.strip()}%"))
+        return filters
 
-        needs_user_join = username is not None
+    async def _count_invoices(
+        self,
+        db: AsyncSession,
+        filters: list,
+        signature: tuple,
+        needs_user_join: bool,
+        approximate: bool = False,
+    ) -> tuple[int, bool]:
         total_query = select(func.count()).select_from(Invoice)
         if needs_user_join:
             total_query = total_query.join(User, Invoice.user_id == User.id)
         if filters:
             total_query = total_query.where(*filters)
-        total_result = await db.execute(total_query)
-        total = total_result.scalar_one()
-        pages = max(1, ceil(total / limit)) if total else 1
-        page = min(max(page, 1), pages)
-        offset = (page - 1) * limit
+        return await count_total(db, "invoices", total_query, signature, approximate=approximate and not filters)
+
+    def _admin_invoices_query(self, filters: list) -> Select:
         invoices_query = (
-            select(Invoice, User.username, User.mark, User.sub_url)
+            select(Invoice, User.username, User.mark, User.sub_url, INVOICE_STATUS_RANK)
             .outerjoin(User, Invoice.user_id == User.id)
-            .order_by(
-                case((Invoice.status.in_((InvoiceStatus.PENDING, InvoiceStatus.PROCESSING)), 0), else_=1),
-                Invoice.created_at.desc(),
-            )
-            .offset(offset)
-            .limit(limit)
+            .order_by(INVOICE_STATUS_RANK, Invoice.created_at.desc(), Invoice.id.desc())
         )
         if filters:
             invoices_query = invoices_query.where(*filters)
-        result = await db.execute(invoices_query)
+        return invoices_query
 
+    def _to_admin_invoice_response(
+        self, invoice: Invoice, username: str | None, mark: str | None, sub_url: str | None
+    ) -> AdminInvoiceResponse:
+        return AdminInvoiceResponse(
+            id=invoice.id,
+            invoice_id=invoice.invoice_id,
+            user_id=invoice.user_id,
+            username=username or "",
+            mark=mark or "",
+            sub_url=sub_url or "",
+            payment_uuid=invoice.payment_uuid,
+            confirmation_url=invoice.confirmation_url,
+            amount=invoice.amount,
+            status=invoice.status,
+            created_at=invoice.created_at,
+            updated_at=invoice.updated_at,
+        )
+
+    async def search_invoices(
+        self, db: AsyncSession, user_ids: list[int], invoice_id: int | None = None, limit: int = 10
+    ) -> list[AdminInvoiceResponse]:
+        filters = []
+        if user_ids:
+            filters.append(Invoice.user_id.in_(user_ids))
+        if invoice_id is not None:
+            filters.append(Invoice.invoice_id == invoice_id)
+        if not filters:
+            return []
+
+        # A direct invoice id match comes first, then invoices follow the rank of their user.
+        order_by = []
+        if invoice_id is not None:
+            order_by.append(case((Invoice.invoice_id == invoice_id, 0), else_=1))
+        if user_ids:
+            order_by.append(case({user_id: rank for rank, user_id in enumerate(user_ids)}, value=Invoice.user_id))
+        query = (
+            self._admin_invoices_query([or_(*filters)])
+            .order_by(None)
+            .order_by(*order_by, INVOICE_STATUS_RANK, Invoice.created_at.desc(), Invoice.id.desc())
+        )
+        result = await db.execute(query.limit(limit))
+        return [
+            self._to_admin_invoice_response(invoice, username, mark, sub_url)
+            for invoice, username, mark, sub_url, _ in result.all()
+        ]
+
+    async def list_invoices(
+        self,
+        db: AsyncSession,
+        page: int = 1,
+        limit: int = 20,
+        user_id: int | None = None,
+        invoice_id: int | None = None,
+        invoice_db_id: int | None = None,
+        username: str | None = None,
+        approximate_total: bool = False,
+    ) -> tuple[list[AdminInvoiceResponse], int, int, bool]:
+        filters = self._invoice_filters(user_id, invoice_id, invoice_db_id, username)
+        total, total_exact = await self._count_invoices(
+            db,
+            filters,
+            (user_id, invoice_id, invoice_db_id, username),
+            needs_user_join=username is not None,
+            approximate=approximate_total,
+        )
+        pages = max(1, ceil(total / limit)) if total else 1
+        if total_exact:
+            page = min(max(page, 1), pages)
+        offset = (page - 1) * limit
+        result = await db.execute(self._admin_invoices_query(filters).offset(offset).limit(limit))
         items = [
-            AdminInvoiceResponse(
-                id=invoice.id,
-                invoice_id=invoice.invoice_id,
-                user_id=invoice.user_id,
-                username=username or "",
-                mark=mark or "",
-                sub_url=sub_url or "",
-                payment_uuid=invoice.payment_uuid,
-                confirmation_url=invoice.confirmation_url,
-                amount=invoice.amount,
-                status=invoice.status,
-                created_at=invoice.created_at,
-                updated_at=invoice.updated_at,
+            self._to_admin_invoice_response(invoice, username, mark, sub_url)
+            for invoice, username, mark, sub_url, _ in result.all()
+        ]
+        return items, total, page, total_exact
+
+    async def list_invoices_by_cursor(
+        self,
+        db: AsyncSession,
+        cursor: str | None = None,
+        limit: int = 20,
+        user_id: int | None = None,
+        invoice_id: int | None = None,
+        invoice_db_id: int | None = None,
+        username: str | None = None,
+        with_total: bool = False,
+        approximate_total: bool = False,
+    ) -> tuple[list[AdminInvoiceResponse], str | None, int | None, bool]:
+        filters = self._invoice_filters(user_id, invoice_id, invoice_db_id, username)
+        invoices_query = self._admin_invoices_query(filters).limit(limit + 1)
+        if cursor:
+            try:
+                rank, created_at, last_id = decode_cursor(cursor, 3)
+                rank, created_at, last_id = int(rank), datetime.fromisoformat(created_at), int(last_id)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            # Matches ORDER BY status_rank ASC, created_at DESC, id DESC. Past the open invoices (rank 1, the
+            # deep pages) this is a single range scan of ix_invoices_status_rank.
+            after_cursor = and_(
+                INVOICE_STATUS_RANK == rank, tuple_(Invoice.created_at, Invoice.id) < (created_at, last_id)
+            )
+            invoices_query = invoices_query.where(
+                after_cursor if rank > 0 else or_(after_cursor, INVOICE_STATUS_RANK == 1)
             )
-            for invoice, username, mark, sub_url in result.all()
+        result = await db.execute(invoices_query)
+        rows = list(result.all())
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last_invoice, *_, last_rank = rows[-1]
+            next_cursor = encode_cursor([last_rank, last_invoice.created_at.isoformat(), last_invoice.id])
+        total, total_exact = None, True
+        if with_total:
+            total, total_exact = await self._count_invoices(
+                db,
+                filters,
+                (user_id, invoice_id, invoice_db_id, username),
+                needs_user_join=username is not None,
+                approximate=approximate_total,
+            )
+        items = [
+            self._to_admin_invoice_response(invoice, username, mark, sub_url)
+            for invoice, username, mark, sub_url, _ in rows
         ]
-        return items, total, page
+        return items, next_cursor, total, total_exact
 
 
 async def get_timeweb_service() -> TimeWebService:
@@ -3,23 +3,29 @@ from datetime import datetime, timedelta
 from math import ceil
 
 from fastapi import Depends, HTTPException
-from sqlalchemy import case, func, select
+from sqlalchemy import case, func, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.cache import invalidate_tags, invalidate_user_identity, user_tag
 from src.core.enums import InvoiceStatus, Role
 from src.core.logger import get_logger
 from src.core.settings import settings
+from src.models.common import decode_cursor, encode_cursor
 from src.models.tw import InvoiceResponse
 from src.models.users import AdminUserResponse, CreateUserRequest, UpdateUserRoleResponse, UserProfileResponse, UserStatsResponse
-from src.models.xui import ClientResponse, CreateClientRequest
+from src.models.xui import ClientResponse, CreateClientRequest, UpdateClientRequest
 from src.schemas.invoices import Invoice
 from src.schemas.registration_codes import RegistrationCode
 from src.schemas.users import User
+from src.services.db import count_total, invalidate_counts, release_connection
 from src.services.jwt import JwtService, get_jwt_service
 from src.services.xui import XuiService, get_xui_service
 
 logger = get_logger()
 
+# pg_trgm needs at least one full trigram; shorter terms only use the prefix path.
+MIN_TRIGRAM_LENGTH = 3
+
 
 @dataclass
 class UserService:
@@ -28,7 +34,8 @@ class UserService:
 
     async def create(self, db: AsyncSession, user: CreateUserRequest, *, registration_code_id: int | None = None) -> str:
         token_position = 0
-        await self.xui_service.add_client_to_inbounds(
+        await release_connection(db)
+        xui_client = await self.xui_service.add_client_to_inbounds(
             CreateClientRequest(
                 email=user.username,
                 comment=user.mark,
@@ -39,9 +46,6 @@ class UserService:
                 enable=user.enable,
             )
         )
-        xui_client = await self.xui_service.get_client_by_email(user.username)
-        if xui_client is None:
-            raise HTTPException(status_code=400, detail="Failed to create XUI client")
 
         db_user = User(
             username=user.username,
@@ -54,13 +58,15 @@ class UserService:
         db.add(db_user)
         await db.flush()
         await db.commit()
+        invalidate_counts("users")
+        await invalidate_tags("users")
         jwt_data = {
             "sub": str(db_user.id),
             "role": str(db_user.role),
             "exp": (datetime.now() + timedelta(days=settings.app.jwt_exp_days)).timestamp(),
             "token_position": token_position,
         }
-        logger.debug(f"Create user with: {jwt_data}")
+        logger.debug("Create user with: %s", jwt_data)
         jwt_token = await self.jwt_service.encode(jwt_data)
         return jwt_token
 
@@ -95,15 +101,7 @@ class UserService:
             registration_code=registration_code,
         )
 
-    async def list_users(
-        self,
-        db: AsyncSession,
-        page: int = 1,
-        limit: int = 20,
-        search: str | None = None,
-        user_id: int | None = None,
-        role: Role | None = None,
-    ) -> tuple[list[AdminUserResponse], int, int]:
+    def _user_filters(self, search: str | None, user_id: int | None, role: Role | None) -> list:
         filters = []
         if search:
             filters.append(User.username.ilike(f"%{search.strip()}%"))
@@ -111,26 +109,109 @@ class UserService:
             filters.append(User.id == user_id)
         if role is not None:
             filters.append(User.role == role)
+        return filters
+
+    async def _to_admin_user_responses(self, db: AsyncSession, users: list[User]) -> list[AdminUserResponse]:
+        registration_codes = await self._registration_codes_by_ids(
+            db,
+            [user.registration_code_id for user in users if user.registration_code_id is not None],
+        )
+        return [self._to_admin_user_response(user, registration_codes) for user in users]
 
+    async def _count_users(
+        self, db: AsyncSession, filters: list, signature: tuple, approximate: bool = False
+    ) -> tuple[int, bool]:
         total_query = select(func.count()).select_from(User)
         if filters:
             total_query = total_query.where(*filters)
-        total_result = await db.execute(total_query)
-        total = total_result.scalar_one()
+        return await count_total(db, "users", total_query, signature, approximate=approximate and not filters)
+
+    async def list_users(
+        self,
+        db: AsyncSession,
+        page: int = 1,
+        limit: int = 20,
+        search: str | None = None,
+        user_id: int | None = None,
+        role: Role | None = None,
+        approximate_total: bool = False,
+    ) -> tuple[list[AdminUserResponse], int, int, bool]:
+        filters = self._user_filters(search, user_id, role)
+        total, total_exact = await self._count_users(db, filters, (search, user_id, role), approximate_total)
         pages = max(1, ceil(total / limit)) if total else 1
-        page = min(max(page, 1), pages)
+        if total_exact:
+            page = min(max(page, 1), pages)
         offset = (page - 1) * limit
         users_query = select(User).order_by(User.id.asc()).offset(offset).limit(limit)
         if filters:
             users_query = users_query.where(*filters)
         result = await db.execute(users_query)
+        items = await self._to_admin_user_responses(db, list(result.scalars().all()))
+        return items, total, page, total_exact
+
+    async def list_users_by_cursor(
+        self,
+        db: AsyncSession,
+        cursor: str | None = None,
+        limit: int = 20,
+        search: str | None = None,
+        user_id: int | None = None,
+        role: Role | None = None,
+        with_total: bool = False,
+        approximate_total: bool = False,
+    ) -> tuple[list[AdminUserResponse], str | None, int | None, bool]:
+        filters = self._user_filters(search, user_id, role)
+        users_query = select(User).order_by(User.id.asc()).limit(limit + 1)
+        if cursor:
+            try:
+                (last_id,) = decode_cursor(cursor, 1)
+                last_id = int(last_id)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            users_query = users_query.where(User.id > last_id)
+        if filters:
+            users_query = users_query.where(*filters)
+        result = await db.execute(users_query)
         users = list(result.scalars().all())
-        registration_codes = await self._registration_codes_by_ids(
-            db,
-            [user.registration_code_id for user in users if user.registration_code_id is not None],
+
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_cursor([users[-1].id])
+        total, total_exact = None, True
+        if with_total:
+            total, total_exact = await self._count_users(db, filters, (search, user_id, role), approximate_total)
+        items = await self._to_admin_user_responses(db, users)
+        return items, next_cursor, total, total_exact
+
+    async def search_users(self, db: AsyncSession, term: str, limit: int = 10) -> list[AdminUserResponse]:
+        # Prefix fast path: usernames starting with the term rank first and often fill the page alone.
+        result = await db.execute(
+            select(User).where(User.username.istartswith(term, autoescape=True)).order_by(User.username).limit(limit)
         )
-        items = [self._to_admin_user_response(user, registration_codes) for user in users]
-        return items, total, page
+        users = list(result.scalars().all())
+
+        if len(users) < limit and len(term) >= MIN_TRIGRAM_LENGTH:
+            score = func.greatest(func.similarity(User.username, term), func.similarity(User.mark, term))
+            query = (
+                select(User)
+                .where(
+                    or_(
+                        User.username.icontains(term, autoescape=True),
+                        User.mark.icontains(term, autoescape=True),
+                        User.username.op("%")(term),
+                        User.mark.op("%")(term),
+                    )
+                )
+                .order_by(score.desc(), User.id)
+                .limit(limit - len(users))
+            )
+            if users:
+                query = query.where(User.id.not_in([user.id for user in users]))
+            result = await db.execute(query)
+            users.extend(result.scalars().all())
+
+        return await self._to_admin_user_responses(db, users)
 
     async def get_admin_user(self, db: AsyncSession, id: int) -> AdminUserResponse:
         user = await self.get_by_id(db, id)
@@ -179,12 +260,24 @@ class UserService:
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
 
+        await release_connection(db)
         xui_client = await self.xui_service.get_client_by_email(user.username)
         if xui_client is not None:
             await self.xui_service.delete_client_by_email(user.username)
 
+        # Deleting a user frees the registration slot they used.
+        if user.registration_code_id is not None:
+            await db.execute(
+                update(RegistrationCode)
+                .where(RegistrationCode.id == user.registration_code_id, RegistrationCode.registrations_count > 0)
+                .values(registrations_count=RegistrationCode.registrations_count - 1)
+                .execution_options(synchronize_session=False)
+            )
         await db.delete(user)
         await db.commit()
+        await invalidate_user_identity(id)
+        invalidate_counts("users")
+        await invalidate_tags("users", "invoices", "codes", user_tag(id))
         return id
 
     async def refresh_token(self, db: AsyncSession, id: int) -> str:
@@ -195,13 +288,14 @@ class UserService:
         user.token_position = token_position
         await db.flush()
         await db.commit()
+        await invalidate_user_identity(user.id)
         jwt_data = {
             "sub": str(user.id),
             "role": str(user.role),
             "exp": (datetime.now() + timedelta(days=settings.app.jwt_exp_days)).timestamp(),
             "token_position": token_position,
         }
-        logger.debug(f"Refresh token for user {user.id} with: {jwt_data}")
+        logger.debug("Refresh token for user %s with: %s", user.id, jwt_data)
         jwt_token = await self.jwt_service.encode(jwt_data)
         return jwt_token
 
@@ -212,7 +306,7 @@ class UserService:
             "exp": (datetime.now() + timedelta(days=settings.app.jwt_exp_days)).timestamp(),
             "token_position": user.token_position,
         }
-        logger.debug(f"Issue token for user {user.id} with: {jwt_data}")
+        logger.debug("Issue token for user %s with: %s", user.id, jwt_data)
         return await self.jwt_service.encode(jwt_data)
 
     async def update_role(self, db: AsyncSession, id: int, role: Role, actor_role: Role) -> UpdateUserRoleResponse:
@@ -233,6 +327,10 @@ class UserService:
         user.token_position += 1
         await db.flush()
         await db.commit()
+        await invalidate_user_identity(user.id)
+        # Role is a list filter.
+        invalidate_counts("users")
+        await invalidate_tags("users", user_tag(user.id))
         token = await self._encode_user_token(user)
         admin_user = await self.get_admin_user(db, user.id)
         return UpdateUserRoleResponse(user=admin_user, token=token)
@@ -244,19 +342,24 @@ class UserService:
         if user.role == Role.SUPERUSER:
             raise HTTPException(status_code=400, detail="Superuser mark cannot be changed")
 
-        user.mark = mark
+        await release_connection(db)
         xui_client = await self.xui_service.get_client_by_email(user.username)
         if xui_client is not None:
             await self.xui_service.update_client_by_email(user.username, UpdateClientRequest(comment=mark))
 
+        user.mark = mark
         await db.flush()
         await db.commit()
+        await invalidate_user_identity(user.id)
+        # Invoice listings show the mark.
+        await invalidate_tags("users", "invoices", user_tag(user.id))
         return await self.get_admin_user(db, user.id)
 
     async def get_xui_user_profile_by_id(self, db: AsyncSession, id: int) -> ClientResponse:
         user = await self.get_by_id(db, id)
         if user is None:
             raise HTTPException(status_code=404, detail="User not found")
+        await release_connection(db)
         xui_client = await self.xui_service.get_client_by_email(user.username)
         if xui_client is None:
             raise HTTPException(status_code=400, detail="User not found in XUI")
@@ -1,13 +1,62 @@
+import asyncio
+import json
 import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from functools import partial
 
 from fastapi import HTTPException
-from httpx import AsyncClient
+from httpx import AsyncClient, Request
+from sqlalchemy import func, select
 
+from src.core.cache import SingleFlight, StaleWhileRevalidateCache
 from src.core.logger import logger
 from src.core.settings import settings
-from src.models.xui import ClientResponse, CreateClientRequest, UpdateClientRequest
+from src.models.common import HttpPoolStatsResponse
+from src.models.xui import (
+    ClientResponse,
+    CreateClientRequest,
+    CreatedClientResponse,
+    UpdateClientRequest,
+    XuiSnapshotStatsResponse,
+)
+from src.schemas.invoices import Invoice
+from src.schemas.users import User
+from src.services.db import SessionLocal
+from src.services.http import create_http_client, get_http_pool_stats
+from src.services.xui_snapshot import XuiClientSnapshot, xui_snapshot
+
+INBOUNDS_CACHE_KEY = "enabled"
+# Inbounds rarely change: a stale list is served while one background request refreshes it.
+xui_inbounds_cache: StaleWhileRevalidateCache[str, list[int]] = StaleWhileRevalidateCache(
+    fresh_seconds=settings.xui.inbounds_cache_ttl_seconds,
+    stale_seconds=settings.xui.inbounds_stale_seconds,
+    max_size=1,
+)
+
+_xui_client: AsyncClient | None = None
+_provisioned_since: datetime | None = None
+_verify_tasks: set[asyncio.Task] = set()
+# Concurrent lookups of one email share a single panel request.
+_client_fetches: SingleFlight[str, ClientResponse | None] = SingleFlight()
+
+
+def _to_client_response(client: dict, inbound_ids: list[int], used_traffic: int) -> ClientResponse:
+    return ClientResponse(
+        id=client["id"],
+        email=client["email"],
+        inbound_ids=inbound_ids,
+        used_traffic=used_traffic,
+        sub_url=f"{settings.xui.sub_url}/{client['subId']}",
+        sub_id=client["subId"],
+        uuid=client["uuid"],
+        flow=client.get("flow", ""),
+        limit_ips=client["limitIp"],
+        total_gb=round(client["totalGB"] / (1024**3), 2),
+        enable=client["enable"],
+        expiry_datetime=datetime.fromtimestamp(client["expiryTime"] / 1000),
+        comment=client.get("comment", ""),
+    )
 
 
 @dataclass
@@ -15,34 +64,50 @@ class XuiService:
     url: str
     api_key: str
     timeout: int
+    client: AsyncClient
+    snapshot: XuiClientSnapshot | None = None
+    inbounds_cache: StaleWhileRevalidateCache[str, list[int]] | None = None
 
     async def get_version(self) -> str:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
         }
-        response = await AsyncClient(timeout=2).get(f"{self.url}/panel/api/server/status", headers=headers)
+        response = await self.client.get(f"{self.url}/panel/api/server/status", headers=headers, timeout=2)
         response.raise_for_status()
         data = response.json()
-        logger.debug(f"XUI status data: {data}")
+        logger.debug("XUI status data: %s", data)
         return data["obj"]["panelVersion"]
 
     async def get_inbounds_ids(self) -> list[int]:
+        if self.inbounds_cache is None:
+            return await self.fetch_inbounds_ids()
+        return list(await self.inbounds_cache.get(INBOUNDS_CACHE_KEY, self.fetch_inbounds_ids))
+
+    async def refresh_inbounds_ids(self) -> list[int]:
+        if self.inbounds_cache is not None:
+            self.inbounds_cache.invalidate(INBOUNDS_CACHE_KEY)
+        return await self.get_inbounds_ids()
+
+    async def fetch_inbounds_ids(self) -> list[int]:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
         }
-        response = await AsyncClient(timeout=self.timeout).get(
+        response = await self.client.get(
             f"{self.url}/panel/api/inbounds/list/slim", headers=headers
         )
         response.raise_for_status()
         data = response.json()
         return [int(item["id"]) for item in data["obj"] if item["enable"] is True]
 
-    async def add_client_to_inbounds(self, client: CreateClientRequest, inbounds_ids: list[int] | None = None) -> str:
+    async def add_client_to_inbounds(
+        self, client: CreateClientRequest, inbounds_ids: list[int] | None = None
+    ) -> CreatedClientResponse:
         if inbounds_ids is None:
             inbounds_ids = await self.get_inbounds_ids()
+        sub_id = str(uuid.uuid4())
         client_payload: dict[str, str | int | bool] = {
             "email": client.email,
-            "subId": str(uuid.uuid4()),
+            "subId": sub_id,
             "comment": client.comment,
             "totalGB": client.total_gb * (1024**3),
             "expiryTime": int((datetime.now() + timedelta(days=client.expiry_time_days)).timestamp()) * 1000,
@@ -59,21 +124,92 @@ class XuiService:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
         }
-        response = await AsyncClient(timeout=self.timeout).post(
+        response = await self.client.post(
             f"{self.url}/panel/api/clients/add", headers=headers, json=data
         )
         response.raise_for_status()
         data = response.json()
         if data["success"] is False:
-            logger.error(f"XUI Error while adding client: {data['msg'].replace('\n', '')}")
+            logger.error("XUI Error while adding client: %s", data["msg"].replace("\n", ""))
+            # A cached inbound may have been removed or disabled in the panel.
+            if self.inbounds_cache is not None:
+                self.inbounds_cache.invalidate(INBOUNDS_CACHE_KEY)
             raise HTTPException(status_code=400, detail="Something went wrong")
-        return str(data["success"])
+        if self.snapshot is not None:
+            self.snapshot.remove(client.email)
+        if settings.xui.verify_created_clients:
+            self._verify_client_later(client.email, sub_id)
+        return CreatedClientResponse(
+            email=client.email,
+            sub_id=sub_id,
+            sub_url=f"{settings.xui.sub_url}/{sub_id}",
+            inbound_ids=inbounds_ids,
+        )
+
+    def _verify_client_later(self, email: str, sub_id: str) -> None:
+        async def verify() -> None:
+            await asyncio.sleep(settings.xui.verify_delay_seconds)
+            try:
+                client = await self.fetch_client_by_email(email)
+            except Exception as e:
+                logger.error("Error verifying XUI client %s: %s", email, e)
+                return
+            if client is None:
+                logger.error("XUI client %s was not found after creation", email)
+            elif client.sub_id != sub_id:
+                logger.error("XUI client %s has unexpected subId %s, expected %s", email, client.sub_id, sub_id)
+
+        task = asyncio.create_task(verify(), name=f"xui-verify-{email}")
+        _verify_tasks.add(task)
+        task.add_done_callback(_verify_tasks.discard)
+
+    async def list_clients(self) -> list[ClientResponse]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+        }
+        response = await self.client.get(f"{self.url}/panel/api/inbounds/list", headers=headers)
+        response.raise_for_status()
+        data = response.json()
+
+        # Traffic is accounted per email, so a client shared by several inbounds reports the same stats in each.
+        clients: dict[str, dict] = {}
+        inbound_ids: dict[str, list[int]] = {}
+        used_traffic: dict[str, int] = {}
+        for inbound in data["obj"]:
+            inbound_settings = inbound["settings"]
+            if isinstance(inbound_settings, str):
+                inbound_settings = json.loads(inbound_settings)
+            stats = {item["email"]: item for item in inbound.get("clientStats") or []}
+            for client in inbound_settings.get("clients", []):
+                email = client["email"]
+                client_stats = stats.get(email, {})
+                if email not in clients:
+                    # Inbound settings keep the protocol credential in "id"; the numeric id lives in clientStats.
+                    clients[email] = {
+                        **client,
+                        "id": client_stats.get("id", 0),
+                        "uuid": client.get("uuid") or str(client.get("id") or client.get("password", "")),
+                    }
+                    inbound_ids[email] = []
+                    used_traffic[email] = client_stats.get("up", 0) + client_stats.get("down", 0)
+                inbound_ids[email].append(int(inbound["id"]))
+
+        return [
+            _to_client_response(client, inbound_ids[email], used_traffic[email]) for email, client in clients.items()
+        ]
 
     async def get_client_by_email(self, email: str) -> ClientResponse | None:
+        if self.snapshot is not None:
+            client = self.snapshot.get(email)
+            if client is not None:
+                return client
+        return await _client_fetches.do(email, partial(self.fetch_client_by_email, email))
+
+    async def fetch_client_by_email(self, email: str) -> ClientResponse | None:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
         }
-        response = await AsyncClient(timeout=self.timeout).get(
+        response = await self.client.get(
             f"{self.url}/panel/api/clients/get/{email}", headers=headers
         )
         response.raise_for_status()
@@ -82,22 +218,11 @@ class XuiService:
             return None
         inbound_ids = [int(item) for item in data["obj"]["inboundIds"]]
         used_traffic = data["obj"]["usedTraffic"]
-        logger.debug(f"XUI client data: {data['obj']['client']}")
-        return ClientResponse(
-            id=data["obj"]["client"]["id"],
-            email=data["obj"]["client"]["email"],
-            inbound_ids=inbound_ids,
-            used_traffic=used_traffic,
-            sub_url=f"{settings.xui.sub_url}/{data['obj']['client']['subId']}",
-            sub_id=data["obj"]["client"]["subId"],
-            uuid=data["obj"]["client"]["uuid"],
-            flow=data["obj"]["client"]["flow"],
-            limit_ips=data["obj"]["client"]["limitIp"],
-            total_gb=round(data["obj"]["client"]["totalGB"] / (1024**3), 2),
-            enable=data["obj"]["client"]["enable"],
-            expiry_datetime=datetime.fromtimestamp(data["obj"]["client"]["expiryTime"] / 1000),
-            comment=data["obj"]["client"]["comment"],
-        )
+        logger.debug("XUI client data: %s", data["obj"]["client"])
+        client = _to_client_response(data["obj"]["client"], inbound_ids, used_traffic)
+        if self.snapshot is not None:
+            self.snapshot.put(client)
+        return client
 
     async def update_client_by_email(self, email: str, client: UpdateClientRequest) -> None:
         headers = {
@@ -119,7 +244,7 @@ class XuiService:
         if len(payload) == 1:
             raise HTTPException(status_code=400, detail="Nothing to update")
 
-        response = await AsyncClient(timeout=self.timeout).post(
+        response = await self.client.post(
             f"{self.url}/panel/api/clients/update/{email}",
             headers=headers,
             json=payload,
@@ -127,42 +252,133 @@ class XuiService:
         response.raise_for_status()
         data = response.json()
         if data["success"] is False:
-            logger.error(f"XUI Error while updating client: {data['msg'].replace('\n', '')}")
+            logger.error("XUI Error while updating client: %s", data["msg"].replace("\n", ""))
             raise HTTPException(status_code=400, detail="Something went wrong")
+        if self.snapshot is not None:
+            updates: dict[str, datetime | bool | int | str] = {}
+            if "expiryTime" in payload:
+                updates["expiry_datetime"] = datetime.fromtimestamp(int(payload["expiryTime"]) / 1000)
+            if client.enable is not None:
+                updates["enable"] = client.enable
+            if client.limit_ips is not None:
+                updates["limit_ips"] = client.limit_ips
+            if client.comment is not None:
+                updates["comment"] = client.comment
+            self.snapshot.patch(email, **updates)
         return str(data["success"])
 
     async def reset_client_traffic_by_email(self, email: str) -> None:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
         }
-        response = await AsyncClient(timeout=self.timeout).post(
+        response = await self.client.post(
             f"{self.url}/panel/api/clients/resetTraffic/{email}", headers=headers
         )
         response.raise_for_status()
         data = response.json()
         if data["success"] is False:
-            logger.error(f"XUI Error while resetting client traffic: {data['msg'].replace('\n', '')}")
+            logger.error("XUI Error while resetting client traffic: %s", data["msg"].replace("\n", ""))
             raise HTTPException(status_code=400, detail="Something went wrong")
+        if self.snapshot is not None:
+            self.snapshot.patch(email, used_traffic=0)
         return str(data["success"])
 
     async def delete_client_by_email(self, email: str) -> None:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
         }
-        response = await AsyncClient(timeout=self.timeout).post(
+        response = await self.client.post(
             f"{self.url}/panel/api/clients/del/{email}?keepTraffic=1", headers=headers
         )
         response.raise_for_status()
         data = response.json()
         if data["success"] is False:
-            logger.error(f"XUI Error while deleting client: {data['msg'].replace('\n', '')}")
+            logger.error("XUI Error while deleting client: %s", data["msg"].replace("\n", ""))
             raise HTTPException(status_code=400, detail="Something went wrong")
+        if self.snapshot is not None:
+            self.snapshot.remove(email)
         return str(data["success"])
 
+    async def refresh_snapshot(self) -> XuiSnapshotStatsResponse:
+        if self.snapshot is None:
+            raise HTTPException(status_code=400, detail="XUI snapshot is disabled")
+        await self.snapshot.refresh(self.list_clients)
+        return self.snapshot.stats()
+
+    def get_pool_stats(self) -> HttpPoolStatsResponse:
+        return get_http_pool_stats(self.client)
+
+
+def xui_operation(request: Request) -> str:
+    # /panel/api/<group>/<action>/<email> -> <group>/<action>; the email must not become a metrics label.
+    segments = request.url.path.split("/panel/api/", 1)[-1].split("/")
+    return "/".join(segments[:2])
+
+
+def init_xui_client() -> AsyncClient:
+    global _xui_client
+    if _xui_client is None or _xui_client.is_closed:
+        _xui_client = create_http_client(
+            name="xui",
+            operation=xui_operation,
+            timeout=settings.app.request_timeout,
+            max_connections=settings.xui.max_connections,
+            max_keepalive_connections=settings.xui.max_keepalive_connections,
+            keepalive_expiry=settings.xui.keepalive_expiry,
+            http2=settings.xui.http2,
+        )
+    return _xui_client
+
+
+async def close_xui_client() -> None:
+    global _xui_client
+    # Pending verifications would otherwise run against the closed client.
+    for task in list(_verify_tasks):
+        task.cancel()
+    await asyncio.gather(*_verify_tasks, return_exceptions=True)
+    if _xui_client is not None:
+        await _xui_client.aclose()
+        _xui_client = None
+
 
 async def get_xui_service() -> XuiService:
     return XuiService(
         url=settings.xui.url,
         api_key=settings.xui.api_key,
         timeout=settings.app.request_timeout,
+        client=init_xui_client(),
+        snapshot=xui_snapshot if settings.xui.snapshot_enabled else None,
+        inbounds_cache=xui_inbounds_cache if settings.xui.inbounds_cache_ttl_seconds > 0 else None,
+    )
+
+
+async def load_xui_clients() -> list[ClientResponse]:
+    xui_service = await get_xui_service()
+    return await xui_service.list_clients()
+
+
+async def sync_provisioned_xui_clients() -> None:
+    # The invoice worker usually runs in its own process, so its extensions never patch this snapshot.
+    # Re-read the clients whose invoices it provisioned since the last check.
+    global _provisioned_since
+    async with SessionLocal() as db:
+        if _provisioned_since is None:
+            _provisioned_since = await db.scalar(select(func.max(Invoice.provisioned_at))) or datetime.min
+            return
+        result = await db.execute(
+            select(User.username, Invoice.provisioned_at)
+            .join(User, Invoice.user_id == User.id)
+            .where(Invoice.provisioned_at > _provisioned_since)
+        )
+        rows = result.all()
+    if not rows:
+        return
+    _provisioned_since = max(provisioned_at for _, provisioned_at in rows)
+    xui_service = await get_xui_service()
+    usernames = {username for username, _ in rows}
+    results = await asyncio.gather(
+        *(xui_service.fetch_client_by_email(username) for username in usernames), return_exceptions=True
     )
+    for username, error in zip(usernames, results):
+        if isinstance(error, BaseException):
+            logger.error("Error syncing XUI client %s: %s", username, error)
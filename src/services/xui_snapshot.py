@@ -0,0 +1,131 @@
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from src.core.logger import logger
+from src.core.settings import settings
+from src.models.xui import ClientResponse, XuiSnapshotStatsResponse
+
+
+@dataclass
+class XuiClientSnapshot:
+    max_age_seconds: float
+    clients: dict[str, ClientResponse] = field(default_factory=dict)
+    refreshed_at: float | None = None
+    hits: int = 0
+    misses: int = 0
+    # Bumped by every patch; a refresh that started before a patch must not overwrite it.
+    generation: int = 0
+    _listed_generation: int = -1
+    _patched: dict[str, tuple[int, ClientResponse | None]] = field(default_factory=dict)
+    _task: asyncio.Task | None = None
+    _sync_task: asyncio.Task | None = None
+
+    @property
+    def is_fresh(self) -> bool:
+        if self.refreshed_at is None:
+            return False
+        return time.monotonic() - self.refreshed_at <= self.max_age_seconds
+
+    def get(self, email: str) -> ClientResponse | None:
+        client = self.clients.get(email) if self.is_fresh else None
+        if client is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return client
+
+    def replace(self, clients: list[ClientResponse], generation: int) -> None:
+        # generation is the value read when the listing was requested.
+        if generation < self._listed_generation:
+            # A listing requested later has already been applied.
+            return
+        fresh = {client.email: client for client in clients}
+        for email, (patched_at, client) in self._patched.items():
+            if patched_at > generation:
+                if client is None:
+                    fresh.pop(email, None)
+                else:
+                    fresh[email] = client
+        self._patched = {email: item for email, item in self._patched.items() if item[0] > generation}
+        self._listed_generation = generation
+        self.clients = fresh
+        self.refreshed_at = time.monotonic()
+
+    def _record(self, email: str, client: ClientResponse | None) -> None:
+        self.generation += 1
+        self._patched[email] = (self.generation, client)
+
+    def put(self, client: ClientResponse) -> None:
+        self.clients[client.email] = client
+        self._record(client.email, client)
+
+    def patch(self, email: str, **fields: Any) -> None:
+        client = self.clients.get(email)
+        if client is not None:
+            self.clients[email] = client.model_copy(update=fields)
+            self._record(email, self.clients[email])
+
+    def remove(self, email: str) -> None:
+        self.clients.pop(email, None)
+        self._record(email, None)
+
+    async def refresh(self, loader: Callable[[], Awaitable[list[ClientResponse]]]) -> None:
+        generation = self.generation
+        self.replace(await loader(), generation)
+
+    def stats(self) -> XuiSnapshotStatsResponse:
+        age = None if self.refreshed_at is None else round(time.monotonic() - self.refreshed_at, 3)
+        return XuiSnapshotStatsResponse(
+            clients=len(self.clients),
+            fresh=self.is_fresh,
+            age_seconds=age,
+            hits=self.hits,
+            misses=self.misses,
+        )
+
+    async def _run(self, loader: Callable[[], Awaitable[list[ClientResponse]]], interval: float) -> None:
+        while True:
+            try:
+                await self.refresh(loader)
+                logger.debug("XUI snapshot refreshed: %s clients", len(self.clients))
+            except Exception as e:
+                logger.error("Error refreshing XUI snapshot: %s", e)
+            await asyncio.sleep(interval)
+
+    async def _run_sync(self, sync: Callable[[], Awaitable[None]], interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await sync()
+            except Exception as e:
+                logger.error("Error syncing XUI snapshot: %s", e)
+
+    def start(
+        self,
+        loader: Callable[[], Awaitable[list[ClientResponse]]],
+        interval: float,
+        sync: Callable[[], Awaitable[None]] | None = None,
+        sync_interval: float = 0,
+    ) -> None:
+        # sync patches entries changed elsewhere (e.g. by a separate worker process) between full refreshes.
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(loader, interval), name="xui-snapshot")
+        if sync is not None and sync_interval > 0 and (self._sync_task is None or self._sync_task.done()):
+            self._sync_task = asyncio.create_task(self._run_sync(sync, sync_interval), name="xui-snapshot-sync")
+
+    async def stop(self) -> None:
+        for task in (self._task, self._sync_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = None
+        self._sync_task = None
+
+
+xui_snapshot = XuiClientSnapshot(max_age_seconds=settings.xui.snapshot_max_age_seconds)
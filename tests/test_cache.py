@@ -0,0 +1,23 @@
+from src.core.cache import app_cache
+from src.core.enums import CacheBackend
+from src.core.settings import settings
+
+
+async def get_invoices() -> list:
+    return []
+
+
+def test_cross_process_endpoints_are_not_cached_with_a_process_local_backend(monkeypatch):
+    monkeypatch.setattr(settings.cache, "backend", CacheBackend.MEMORY)
+    monkeypatch.setattr(settings.worker, "enabled", False)
+    assert app_cache(tags=("invoices",), cross_process=True)(get_invoices) is get_invoices
+    assert app_cache(tags=("invoices",))(get_invoices) is not get_invoices
+
+
+def test_cross_process_endpoints_are_cached_when_invalidations_are_shared(monkeypatch):
+    monkeypatch.setattr(settings.cache, "backend", CacheBackend.REDIS)
+    assert app_cache(tags=("invoices",), cross_process=True)(get_invoices) is not get_invoices
+
+    monkeypatch.setattr(settings.cache, "backend", CacheBackend.MEMORY)
+    monkeypatch.setattr(settings.worker, "enabled", True)
+    assert app_cache(tags=("invoices",), cross_process=True)(get_invoices) is not get_invoices
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from src.core.cache_backends import InProcessInvalidationBus, LocalBackend, PostgresInvalidationBus, TieredBackend
+
+TAG_KEY = "fast-ray-gram:tag:user:1"
+
+
+async def start_pair(shared: LocalBackend, bus: InProcessInvalidationBus) -> TieredBackend:
+    backend = TieredBackend(shared, LocalBackend(), local_ttl_seconds=60, bus=bus)
+    await backend.start()
+    return backend
+
+
+async def test_clear_on_one_process_evicts_the_other_local_tier():
+    # Two processes: one shared store, one bus, a local tier each.
+    shared = LocalBackend()
+    bus = InProcessInvalidationBus()
+    first = await start_pair(shared, bus)
+    second = await start_pair(shared, bus.attach())
+
+    await first.set(TAG_KEY, b"old", 60)
+    assert await second.get(TAG_KEY) == b"old"
+    assert await second.local.get(TAG_KEY) == b"old"
+
+    await first.clear(key=TAG_KEY)
+
+    assert await second.local.get(TAG_KEY) is None
+    assert await second.get(TAG_KEY) is None
+
+
+async def test_namespace_clear_keeps_other_namespaces():
+    shared = LocalBackend()
+    bus = InProcessInvalidationBus()
+    first = await start_pair(shared, bus)
+    second = await start_pair(shared, bus.attach())
+
+    await second.set("a:1", b"1", 60)
+    await second.set("b:1", b"1", 60)
+    await first.clear(namespace="a")
+
+    assert await second.local.get("a:1") is None
+    assert await second.local.get("b:1") == b"1"
+
+
+async def test_stopped_pair_no_longer_receives_invalidations():
+    shared = LocalBackend()
+    bus = InProcessInvalidationBus()
+    first = await start_pair(shared, bus)
+    second = await start_pair(shared, bus.attach())
+
+    await second.set(TAG_KEY, b"old", 60)
+    await second.stop()
+    await first.clear(key=TAG_KEY)
+
+    assert await second.local.get(TAG_KEY) == b"old"
+
+
+async def test_local_backend_purges_entries_that_are_never_read_again():
+    backend = LocalBackend()
+    backend.purge_interval_seconds = 0
+    await backend.set("orphan", b"old", 60)
+    backend._store["orphan"].ttl_ts -= 120
+
+    await backend.set("fresh", b"new", 60)
+
+    assert set(backend._store) == {"fresh"}
+
+
+async def test_postgres_bus_keeps_dispatch_tasks_until_done():
+    bus = PostgresInvalidationBus(engine=None, channel="test")
+    received = asyncio.Event()
+
+    async def on_invalidate(namespace, key):
+        received.set()
+
+    payload = json.dumps({"origin": "another-process", "namespace": None, "key": TAG_KEY})
+    bus._spawn(payload, on_invalidate)
+    assert len(bus._dispatches) == 1
+    await asyncio.wait_for(received.wait(), 1)
+    await asyncio.sleep(0)
+    assert not bus._dispatches
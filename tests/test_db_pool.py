@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.models.users import CreateUserRequest
+from src.models.xui import CreatedClientResponse
+from src.schemas import Base, RegistrationCode, User
+from src.services import users
+from src.services.db import MeteredQueuePool, pool_metrics
+from src.services.jwt import JwtService
+from src.services.users import UserService
+
+# One pooled connection, and a panel call longer than the checkout timeout.
+POOL_SIZE = 1
+POOL_TIMEOUT = 0.2
+PANEL_SECONDS = 0.3
+REQUESTS = 5
+
+
+class SlowXuiService:
+    # Stands in for the panel: every call sleeps and records how many connections are checked out meanwhile.
+    def __init__(self, pool) -> None:
+        self.pool = pool
+        self.checked_out_during_calls: list[int] = []
+
+    async def _call(self) -> None:
+        self.checked_out_during_calls.append(self.pool.checkedout())
+        await asyncio.sleep(PANEL_SECONDS)
+
+    async def add_client_to_inbounds(self, client, inbounds_ids=None) -> CreatedClientResponse:
+        await self._call()
+        return CreatedClientResponse(email=client.email, sub_id="sub", sub_url="https://sub", inbound_ids=[1])
+
+    async def get_client_by_email(self, email: str) -> object:
+        await self._call()
+        return object()
+
+    async def update_client_by_email(self, email: str, client) -> None:
+        await self._call()
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=MeteredQueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=0,
+        pool_timeout=POOL_TIMEOUT,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[RegistrationCode.__table__, User.__table__])
+        await conn.execute(
+            text(
+                "INSERT INTO users (id, username, role, token_position, sub_url, mark, created_at, updated_at) "
+                "VALUES (1, 'user1', 'user', 0, '', '', CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"
+            )
+        )
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+
+
+@pytest.fixture
+def xui_service(engine):
+    return SlowXuiService(engine.sync_engine.pool)
+
+
+@pytest.fixture
+def user_service(xui_service):
+    return UserService(jwt_service=JwtService(secret="secret", algorithm="HS256"), xui_service=xui_service)
+
+
+async def create_user(session_factory, user_service: UserService, username: str) -> None:
+    async with session_factory() as db:
+        # Request dependencies (auth, registration code) have already queried in this session.
+        await db.execute(select(User.id).where(User.id == 1))
+        await user_service.create(db, CreateUserRequest(username=username))
+
+
+async def update_mark(session_factory, user_service: UserService, mark: str) -> None:
+    async with session_factory() as db:
+        await user_service.update_mark(db, 1, mark)
+
+
+async def test_panel_calls_run_without_a_checked_out_connection(session_factory, user_service, xui_service):
+    await create_user(session_factory, user_service, "user2")
+    await update_mark(session_factory, user_service, "vip")
+
+    assert xui_service.checked_out_during_calls == [0, 0, 0]
+    async with session_factory() as db:
+        assert (await user_service.get_by_id(db, 1)).mark == "vip"
+
+
+async def test_concurrent_panel_calls_do_not_time_out_pool_checkouts(session_factory, user_service):
+    await asyncio.gather(
+        *(create_user(session_factory, user_service, f"new{index}") for index in range(REQUESTS)),
+        *(update_mark(session_factory, user_service, f"mark{index}") for index in range(REQUESTS)),
+    )
+
+
+async def test_holding_the_connection_across_panel_calls_times_out(session_factory, user_service, monkeypatch):
+    # Control: the same load fails once the services stop releasing the connection.
+    async def keep_connection(db: AsyncSession) -> None:
+        return None
+
+    monkeypatch.setattr(users, "release_connection", keep_connection)
+    results = await asyncio.gather(
+        *(update_mark(session_factory, user_service, f"mark{index}") for index in range(REQUESTS)),
+        return_exceptions=True,
+    )
+    assert any(isinstance(result, PoolTimeoutError) for result in results)
+
+
+async def test_only_blocked_checkouts_are_recorded_as_waits(session_factory, engine):
+    waits = pool_metrics.waits
+    for _ in range(REQUESTS):
+        async with session_factory() as db:
+            await db.execute(text("SELECT 1"))
+    assert pool_metrics.waits == waits
+
+    async def hold_connection() -> None:
+        async with session_factory() as db:
+            await db.execute(text("SELECT 1"))
+            await asyncio.sleep(POOL_TIMEOUT / 4)
+            await db.commit()
+
+    await asyncio.gather(hold_connection(), hold_connection())
+    assert pool_metrics.waits == waits + 1
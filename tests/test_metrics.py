@@ -0,0 +1,40 @@
+import asyncio
+
+from src.core.settings import settings
+from src.services import metrics, xui
+from src.services.invoice_worker import invoice_worker
+
+
+async def fetch(port: int, headers: str = "") -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"GET /metrics HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def test_scrape_does_not_create_the_xui_client(monkeypatch):
+    monkeypatch.setattr(xui, "_xui_client", None)
+    assert list(metrics._xui_pool_samples()) == []
+    assert xui._xui_client is None
+
+
+def test_worker_state_is_reported_only_where_the_worker_runs(monkeypatch):
+    monkeypatch.setattr(invoice_worker, "running", False)
+    assert list(metrics._worker_samples()) == []
+    monkeypatch.setattr(invoice_worker, "running", True)
+    assert dict(metrics._worker_samples()) == {("leader",): 0, ("consecutive_failures",): 0}
+
+
+async def test_worker_metrics_server_requires_the_superuser_token():
+    server = await metrics.start_metrics_server("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        assert (await fetch(port)).startswith(b"HTTP/1.1 401")
+        response = await fetch(port, f"Authorization: Bearer {settings.app.superuser_token}\r\n")
+        assert response.startswith(b"HTTP/1.1 200")
+        assert b"frg_invoice_worker_run_duration_seconds" in response
+    finally:
+        server.close()
+        await server.wait_closed()
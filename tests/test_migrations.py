@@ -0,0 +1,90 @@
+import os
+import uuid
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.migrations.runner import ConcurrentIndex, Migration, apply_migrations
+from src.migrations.versions import MIGRATIONS
+from src.schemas import Base
+
+# Migrations need PostgreSQL; each test works in its own schema, which is dropped afterwards.
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+LOCK_KEY = 731_999
+
+pytestmark = pytest.mark.skipif(DATABASE_URL is None, reason="TEST_DATABASE_URL is not set")
+
+
+@pytest.fixture
+async def engine():
+    schema = f"test_{uuid.uuid4().hex}"
+    admin = create_async_engine(DATABASE_URL, connect_args={"ssl": False})
+    async with admin.begin() as conn:
+        await conn.execute(text(f"CREATE SCHEMA {schema}"))
+    engine = create_async_engine(
+        DATABASE_URL, connect_args={"ssl": False, "server_settings": {"search_path": f"{schema},public"}}
+    )
+    yield engine
+    await engine.dispose()
+    async with admin.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    await admin.dispose()
+
+
+async def applied_versions(engine) -> list[tuple[int, str]]:
+    async with engine.connect() as conn:
+        result = await conn.execute(text("SELECT version, name FROM schema_migrations ORDER BY applied_at, version"))
+        return [tuple(row) for row in result]
+
+
+async def test_migrations_apply_in_order_and_only_once(engine):
+    migrations = [
+        Migration(1, "create", ("CREATE TABLE items (id INTEGER PRIMARY KEY)",)),
+        Migration(2, "add_column", ("ALTER TABLE items ADD COLUMN name VARCHAR",)),
+        Migration(3, "index", (ConcurrentIndex("ix_items_name", "items (name)"),), concurrent=True),
+    ]
+
+    assert await apply_migrations(engine, migrations[:2], LOCK_KEY) == [1, 2]
+    assert await apply_migrations(engine, migrations, LOCK_KEY) == [3]
+    assert await apply_migrations(engine, migrations, LOCK_KEY) == []
+    assert await applied_versions(engine) == [(1, "create"), (2, "add_column"), (3, "index")]
+
+
+async def test_failed_migration_is_rolled_back_and_retried(engine):
+    migrations = [
+        Migration(1, "create", ("CREATE TABLE items (id INTEGER PRIMARY KEY)",)),
+        Migration(2, "broken", ("ALTER TABLE items ADD COLUMN name VARCHAR", "SELECT missing_column FROM items")),
+    ]
+
+    with pytest.raises(Exception):
+        await apply_migrations(engine, migrations, LOCK_KEY)
+    assert await applied_versions(engine) == [(1, "create")]
+
+    migrations[1] = Migration(2, "fixed", ("ALTER TABLE items ADD COLUMN name VARCHAR",))
+    assert await apply_migrations(engine, migrations, LOCK_KEY) == [2]
+
+
+async def test_project_migrations_build_the_model_schema(engine):
+    async with engine.connect() as conn:
+        available = await conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+        if available.scalar_one_or_none() is None:
+            pytest.skip("pg_trgm is not available on this server")
+
+    versions = [migration.version for migration in MIGRATIONS]
+    assert await apply_migrations(engine, MIGRATIONS, LOCK_KEY) == versions
+    assert await apply_migrations(engine, MIGRATIONS, LOCK_KEY) == []
+
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT table_name, column_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema()"
+            )
+        )
+        columns = set(result.all())
+        result = await conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()"))
+        indexes = set(result.scalars())
+    for table in Base.metadata.tables.values():
+        assert {(table.name, column.name) for column in table.columns} <= columns
+        assert {index.name for index in table.indexes} <= indexes
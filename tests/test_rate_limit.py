@@ -0,0 +1,35 @@
+import ipaddress
+
+import pytest
+from pydantic import ValidationError
+from starlette.requests import Request
+
+from src.core import rate_limit
+from src.core.settings import RateLimitSettings
+
+
+def request(peer: str, real_ip: str | None = None) -> Request:
+    headers = [(b"x-real-ip", real_ip.encode())] if real_ip else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 12345)})
+
+
+@pytest.fixture
+def trusted_proxies(monkeypatch):
+    proxies = [ipaddress.ip_network("172.16.0.0/12")]
+    monkeypatch.setattr(rate_limit.settings.rate_limit, "trusted_proxies", proxies)
+
+
+def test_real_ip_header_is_ignored_by_default():
+    assert rate_limit.get_client_key(request("203.0.113.7", real_ip="198.51.100.1")) == "203.0.113.7"
+
+
+def test_real_ip_header_is_used_only_from_trusted_proxies(trusted_proxies):
+    assert rate_limit.get_client_key(request("172.18.0.5", real_ip="198.51.100.1")) == "198.51.100.1"
+    assert rate_limit.get_client_key(request("172.18.0.5")) == "172.18.0.5"
+    assert rate_limit.get_client_key(request("203.0.113.7", real_ip="198.51.100.1")) == "203.0.113.7"
+
+
+@pytest.mark.parametrize("rate", [0, -1])
+def test_non_positive_rate_is_rejected(rate):
+    with pytest.raises(ValidationError):
+        RateLimitSettings(register_rate_per_second=rate)
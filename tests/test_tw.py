@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import httpx
+import pytest
+
+from src.core.settings import settings
+from src.services import tw
+from src.services.tw import get_timeweb_service
+
+
+def payment(date: str, type: str = "incom", invoice: int | None = 1) -> dict:
+    return {
+        "date": date,
+        "description": "",
+        "invoice": invoice,
+        "payment_type": "card",
+        "sum": 100,
+        "type": type,
+        "vds_id": None if invoice is None else 1,
+    }
+
+
+@pytest.fixture
+def panel(monkeypatch):
+    # Serves the given pages of payments (newest first), one per offset.
+    pages: list[list[dict]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        index = int(request.url.params["offset"]) // int(request.url.params["limit"])
+        return httpx.Response(200, json={"payments": pages[index] if index < len(pages) else []})
+
+    monkeypatch.setattr(tw, "TracedTransport", lambda service: httpx.MockTransport(handler))
+    monkeypatch.setattr(settings.timeweb, "payments_page_size", 2)
+    return pages
+
+
+async def test_non_incoming_rows_without_an_invoice_are_skipped(panel):
+    panel.append([payment("2026-10-02T10:00:00", type="charge", invoice=None), payment("2026-10-01T10:00:00")])
+
+    payments, complete = await (await get_timeweb_service()).scan_payments()
+
+    assert [item.invoice for item in payments] == [1]
+    assert complete
+
+
+async def test_scan_stops_at_the_cursor_date(panel):
+    panel.append([payment("2026-10-03T10:00:00"), payment("2026-10-02T10:00:00", type="charge", invoice=None)])
+    panel.append([payment("2026-09-01T10:00:00", invoice=2), payment("2026-08-01T10:00:00", invoice=3)])
+
+    payments, complete = await (await get_timeweb_service()).scan_payments(since=datetime(2026, 9, 15))
+
+    assert [item.invoice for item in payments] == [1]
+    assert complete
+
+
+async def test_scan_that_runs_out_of_pages_is_incomplete(panel, monkeypatch):
+    monkeypatch.setattr(settings.timeweb, "payments_max_pages", 1)
+    panel.append([payment("2026-10-03T10:00:00"), payment("2026-10-02T10:00:00", invoice=2)])
+    panel.append([payment("2026-09-01T10:00:00", invoice=3)])
+
+    payments, complete = await (await get_timeweb_service()).scan_payments(since=datetime(2026, 8, 1))
+
+    assert [item.invoice for item in payments] == [1, 2]
+    assert not complete
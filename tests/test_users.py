@@ -0,0 +1,69 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.models.common import decode_cursor, encode_cursor
+from src.schemas import Base, RegistrationCode, User
+from src.services import users
+from src.services.jwt import JwtService
+from src.services.users import UserService
+
+
+@pytest.fixture
+async def db(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[RegistrationCode.__table__, User.__table__])
+        await conn.execute(insert(User), [{"id": id, "username": f"user{id}"} for id in range(1, 6)])
+    async with async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+
+@pytest.fixture
+def user_service():
+    return UserService(jwt_service=JwtService(secret="secret", algorithm="HS256"), xui_service=None)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor([0, "2026-10-01T10:00:00", 42]), 3) == [0, "2026-10-01T10:00:00", 42]
+
+
+async def test_cursor_pages_cover_every_user_once(db, user_service):
+    ids, cursor = [], None
+    while True:
+        items, cursor, _, _ = await user_service.list_users_by_cursor(db, cursor=cursor, limit=2)
+        ids.extend(item.id for item in items)
+        if cursor is None:
+            break
+    assert ids == [1, 2, 3, 4, 5]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    ["not base64!", encode_cursor(["x"]), encode_cursor([[1]]), encode_cursor([None]), encode_cursor([1, 2])],
+)
+async def test_malformed_cursor_is_rejected(db, user_service, cursor):
+    with pytest.raises(HTTPException) as error:
+        await user_service.list_users_by_cursor(db, cursor=cursor)
+    assert error.value.status_code == 400
+
+
+class NoPanelClient:
+    async def get_client_by_email(self, email: str) -> None:
+        return None
+
+
+async def test_update_mark_invalidates_invoice_listings(db, monkeypatch):
+    invalidated: list[str] = []
+
+    async def record(*tags: str) -> None:
+        invalidated.extend(tags)
+
+    monkeypatch.setattr(users, "invalidate_tags", record)
+    user_service = UserService(jwt_service=JwtService(secret="secret", algorithm="HS256"), xui_service=NoPanelClient())
+
+    await user_service.update_mark(db, 1, "vip")
+
+    assert {"users", "invoices", "user:1"} <= set(invalidated)
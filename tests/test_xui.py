@@ -0,0 +1,26 @@
+import asyncio
+
+from src.core.settings import settings
+from src.services import xui
+
+
+def test_created_clients_are_not_verified_by_default():
+    assert settings.xui.verify_created_clients is False
+
+
+async def test_close_cancels_pending_verifications(monkeypatch):
+    monkeypatch.setattr(settings.xui, "verify_delay_seconds", 60)
+    fetched = []
+
+    class Service:
+        async def fetch_client_by_email(self, email: str) -> None:
+            fetched.append(email)
+
+    xui.XuiService._verify_client_later(Service(), "user1", "sub")
+    (task,) = xui._verify_tasks
+
+    await xui.close_xui_client()
+
+    assert task.cancelled()
+    assert not xui._verify_tasks
+    assert not fetched
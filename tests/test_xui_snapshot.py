@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime
+
+from src.models.xui import ClientResponse
+from src.services.xui_snapshot import XuiClientSnapshot
+
+
+def client(email: str, comment: str = "") -> ClientResponse:
+    return ClientResponse(
+        id=1,
+        email=email,
+        sub_id=email,
+        sub_url=f"https://sub/{email}",
+        uuid=email,
+        flow="",
+        limit_ips=0,
+        total_gb=0,
+        enable=True,
+        expiry_datetime=datetime(2030, 1, 1),
+        comment=comment,
+        used_traffic=0,
+        inbound_ids=[1],
+    )
+
+
+class SlowListing:
+    # The panel listing: returns the clients as they were when requested, once released.
+    def __init__(self, clients: list[ClientResponse]) -> None:
+        self.clients = clients
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> list[ClientResponse]:
+        clients = list(self.clients)
+        await self.release.wait()
+        return clients
+
+
+async def refresh_around(snapshot: XuiClientSnapshot, listing: SlowListing, change) -> None:
+    refresh = asyncio.create_task(snapshot.refresh(listing))
+    await asyncio.sleep(0)
+    change()
+    listing.release.set()
+    await refresh
+
+
+async def test_refresh_started_before_put_keeps_the_new_client():
+    snapshot = XuiClientSnapshot(max_age_seconds=60)
+    snapshot.replace([client("a")], snapshot.generation)
+
+    await refresh_around(snapshot, SlowListing([client("a")]), lambda: snapshot.put(client("b")))
+
+    assert set(snapshot.clients) == {"a", "b"}
+
+
+async def test_refresh_started_before_remove_does_not_restore_the_client():
+    snapshot = XuiClientSnapshot(max_age_seconds=60)
+    snapshot.replace([client("a"), client("b")], snapshot.generation)
+
+    await refresh_around(snapshot, SlowListing([client("a"), client("b")]), lambda: snapshot.remove("b"))
+
+    assert set(snapshot.clients) == {"a"}
+
+
+async def test_refresh_started_before_patch_keeps_the_patch():
+    snapshot = XuiClientSnapshot(max_age_seconds=60)
+    snapshot.replace([client("a")], snapshot.generation)
+
+    await refresh_around(snapshot, SlowListing([client("a")]), lambda: snapshot.patch("a", comment="vip"))
+
+    assert snapshot.clients["a"].comment == "vip"
+
+
+async def test_patches_older_than_the_listing_are_dropped():
+    snapshot = XuiClientSnapshot(max_age_seconds=60)
+    snapshot.put(client("b"))
+
+    # The listing was requested after the put, so it is authoritative for "b".
+    snapshot.replace([client("a")], snapshot.generation)
+
+    assert set(snapshot.clients) == {"a"}
+    assert not snapshot._patched
+
+
+async def test_older_listing_is_dropped_after_a_newer_one():
+    snapshot = XuiClientSnapshot(max_age_seconds=60)
+    older = SlowListing([client("a")])
+    older_refresh = asyncio.create_task(snapshot.refresh(older))
+    await asyncio.sleep(0)
+
+    snapshot.put(client("b"))
+    newer = SlowListing([client("a"), client("b"), client("c")])
+    newer.release.set()
+    await snapshot.refresh(newer)
+
+    older.release.set()
+    await older_refresh
+
+    assert set(snapshot.clients) == {"a", "b", "c"}